@@ -1,17 +1,20 @@
 import os
 from dotenv import load_dotenv
-from cocreate import create_app
-from cocreate.utils import db, log
-from flask_cors import CORS
 
+# Loaded before importing the app, whose modules read their settings on import
 load_dotenv()
 
-app = create_app()
-CORS(app)
-
-log.generate()
+from cocreate import create_app
+from cocreate.utils import log
+from flask_cors import CORS
 
+# Password hashing workers are spawned and re-import this module as
+# __mp_main__, so the app is only built when it runs as the main script
 if __name__ == "__main__":
-    db.create_database()
+    app = create_app()
+    CORS(app)
+
+    log.generate()
+
     port = int(os.getenv("PORT", 5000))
     app.run(port=port)
@@ -1,7 +1,29 @@
+import multiprocessing
+import os
+import threading
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from cocreate import auth, generate, settings, generations, user
+from cocreate.utils import db, llm, jobs
+
+# Reverse proxies in front of the app. Their X-Forwarded-For and
+# X-Forwarded-Proto headers are trusted, so request.remote_addr (the key of
+# the rate limits) is the client's address. Keep it 0 (the default) when
+# clients reach the app directly, or they could choose their own address.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", 0))
 
 def create_app():
+    # Helper processes (the password hashing pool) must not migrate the
+    # database or run jobs, even if they end up importing the app
+    if multiprocessing.parent_process() is None:
+        # Every worker runs the migrations on startup; they are applied only once
+        db.create_database()
+        threading.Thread(target=db.run_backfills, name="db-backfills", daemon=True).start()
+        # Opens the connection to the model so the first generation skips the handshake
+        threading.Thread(target=llm.warmup, name="llm-warmup", daemon=True).start()
+        # Picks up the jobs a previous worker left unfinished
+        threading.Thread(target=jobs.resume, name="jobs-resume", daemon=True).start()
+
     app = Flask(__name__)
     app.register_blueprint(auth.bp)
     app.register_blueprint(generate.bp)
@@ -9,4 +31,7 @@ def create_app():
     app.register_blueprint(generations.bp)
     app.register_blueprint(user.bp)
 
-    return app
\ No newline at end of file
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+    return app
@@ -1,11 +1,25 @@
 import jwt
-import os
-from flask import Blueprint, request
-from .utils import db, validate, password, log
+from flask import Blueprint, g, request
+from .utils import db, validate, password, log, tokens, ratelimit, principal
 from datetime import datetime
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
+# Returned when the password hashing pool is saturated
+BUSY_RESPONSE = (
+    {"success": False, "message": "El servidor está ocupado, inténtalo de nuevo en unos segundos"},
+    503,
+    {"Retry-After": "1"},
+)
+
+
+def _throttled(retry_after):
+    return (
+        {"success": False, "message": "Demasiados intentos, inténtalo de nuevo más tarde"},
+        429,
+        {"Retry-After": str(retry_after)},
+    )
+
 
 @bp.post("/login")
 def login():
@@ -22,40 +36,57 @@ def login():
             "success": true, 
             "message": "Inicio de sesión exitoso", 
             "access_token": "<jwt_token>",
+            "refresh_token": "<jwt_token>",
+            "expires_in": int - Seconds until the access token expires,
             "user": {user_object}
         }
         400 Bad Request: {"success": false, "message": error_message}
+        429 Too Many Requests: {"success": false, "message": error_message} - With a Retry-After header
     """
     data = request.json or {}
 
     username = data.get("username", "").lower()
     pwd = data.get("password", "")
 
+    # Throttle guessing before any lookup or bcrypt work
+    retry_after = ratelimit.check_auth_attempt(request.remote_addr, username)
+    if retry_after:
+        log.append(f"{datetime.now()} Intento de inicio de sesión bloqueado para el usuario {username}: Demasiados intentos.")
+        return _throttled(retry_after)
+
     # Validate user exists
-    user_result = db.get_user_by_username(username)
-    if not user_result["success"]:
+    credentials = db.get_credentials_by_username(username)
+    if not credentials["success"]:
         log.append(f"{datetime.now()} Intento de inicio de sesión fallido para el usuario {username}: Usuario no encontrado.")
-        return user_result, 400
+        return {"success": False, "message": credentials["message"]}, 400
 
     # Validate password
-    user = user_result["user"]
-    stored_password = db.get_user_password_by_id(user["id"])
-    if not password.valid(pwd, stored_password):
-        log.append(f"{datetime.now()} Intento de inicio de sesión fallido para el usuario {username}: Contraseña inválida.")
-        return {"success": False, "message": "Contraseña inválida"}, 400
-
-    # Generate JWT token
-    encoded_jwt = jwt.encode(
-        {"id": user["id"]}, os.getenv("JWT_SECRET"), algorithm="HS256"
-    )
-    
+    user = credentials["user"]
+    stored_password = credentials["password"]
+    try:
+        if not password.valid(pwd, stored_password):
+            log.append(f"{datetime.now()} Intento de inicio de sesión fallido para el usuario {username}: Contraseña inválida.")
+            return {"success": False, "message": "Contraseña inválida"}, 400
+    except password.Busy:
+        log.append(f"{datetime.now()} Intento de inicio de sesión rechazado para el usuario {username}: Servidor ocupado.")
+        return BUSY_RESPONSE
+
+    # Upgrade hashes made with an older work factor while we have the password
+    if password.needs_rehash(stored_password):
+        try:
+            db.rehash_user_password(user["id"], stored_password, password.hash(pwd))
+        except password.Busy:
+            pass
+
     # Log successful login
     log.append(f"{datetime.now()} Usuario {username} inició sesión con éxito.")
 
     return {
         "success": True,
         "message": "Inicio de sesión exitoso",
-        "access_token": encoded_jwt,
+        "access_token": tokens.create_access_token(user),
+        "refresh_token": tokens.create_refresh_token(user),
+        "expires_in": tokens.ACCESS_TOKEN_TTL,
         "user": user,
     }, 200
 
@@ -75,15 +106,23 @@ def register():
             "success": true, 
             "message": "Registro exitoso", 
             "access_token": "<jwt_token>",
+            "refresh_token": "<jwt_token>",
+            "expires_in": int - Seconds until the access token expires,
             "user": {user_object}
         }
         400 Bad Request: {"success": false, "message": error_message}
+        429 Too Many Requests: {"success": false, "message": error_message} - With a Retry-After header
     """
     data = request.json or {}
 
     username = data.get("username", "").lower()
     pwd = data.get("password", "")
 
+    retry_after = ratelimit.check_auth_attempt(request.remote_addr, username)
+    if retry_after:
+        log.append(f"{datetime.now()} Intento de registro bloqueado para el usuario {username}: Demasiados intentos.")
+        return _throttled(retry_after)
+
     # Validate username
     username_validation = validate.is_username_valid(username)
     if not username_validation["success"]:
@@ -97,7 +136,12 @@ def register():
         return password_validation, 400
 
     # Create user
-    create_result = db.create_user(username, pwd)
+    try:
+        create_result = db.create_user(username, pwd)
+    except password.Busy:
+        log.append(f"{datetime.now()} Intento de registro rechazado para el usuario {username}: Servidor ocupado.")
+        return BUSY_RESPONSE
+
     if not create_result["success"]:
         log.append(f"{datetime.now()} Intento de registro fallido para el usuario {username}: {create_result['message']}")
         return create_result, 400
@@ -105,22 +149,84 @@ def register():
     # Get user and generate token
     user_result = db.get_user_by_username(create_result["username"])
     user = user_result["user"]
-    encoded_jwt = jwt.encode(
-        {"id": user["id"]}, os.getenv("JWT_SECRET"), algorithm="HS256"
-    )
 
     log.append(f"{datetime.now()} Usuario {username} registrado con éxito.")
 
     return {
         "success": True,
         "message": "Registro exitoso",
-        "access_token": encoded_jwt,
+        "access_token": tokens.create_access_token(user),
+        "refresh_token": tokens.create_refresh_token(user),
+        "expires_in": tokens.ACCESS_TOKEN_TTL,
         "user": user,
     }, 200
 
 
+@bp.post("/refresh")
+def refresh():
+    """Exchange a refresh token for a new access token with the current profile.
+    
+    Request Body:
+        {
+            "refresh_token": "string" - Required. The refresh token returned by login or register
+        }
+        
+    Returns:
+        200 OK: {
+            "success": true, 
+            "message": "Token renovado", 
+            "access_token": "<jwt_token>",
+            "expires_in": int - Seconds until the access token expires
+        }
+        401 Unauthorized: {"success": false, "message": error_message}
+    """
+    data = request.json or {}
+    refresh_token = data.get("refresh_token", "")
+
+    if not refresh_token:
+        log.append(f"{datetime.now()} No se pudo renovar el token: Token de renovación requerido.")
+        return {"success": False, "message": "Token de renovación requerido"}, 401
+
+    try:
+        payload = tokens.decode(refresh_token)
+    except jwt.ExpiredSignatureError:
+        log.append(f"{datetime.now()} No se pudo renovar el token: Token expirado.")
+        return {"success": False, "message": "Token expirado"}, 401
+    except jwt.InvalidTokenError:
+        log.append(f"{datetime.now()} No se pudo renovar el token: Token inválido.")
+        return {"success": False, "message": "Token inválido"}, 401
+
+    if payload.get("type") != "refresh":
+        log.append(f"{datetime.now()} No se pudo renovar el token: Formato del token inválido.")
+        return {"success": False, "message": "Formato del token inválido"}, 401
+
+    # The profile or the password may have changed in any worker since the
+    # last token, so read them from the database rather than a cache
+    user = principal.Principal(id=payload.get("id"))
+    if not user.load(*tokens.PROFILE_CLAIMS, "profile_version", "credential_version"):
+        log.append(f"{datetime.now()} No se pudo renovar el token: No se encontró el usuario.")
+        return {"success": False, "message": "Token inválido - no se encuentra el usuario"}, 401
+
+    if tokens.is_refresh_revoked(payload, user):
+        log.append(f"{datetime.now()} No se pudo renovar el token del usuario {user['username']}: Token revocado.")
+        return {"success": False, "message": "Token revocado"}, 401
+
+    tokens.record_profile_version(user["id"], user["profile_version"])
+
+    log.append(f"{datetime.now()} Token del usuario {user['username']} renovado con éxito.")
+
+    return {
+        "success": True,
+        "message": "Token renovado",
+        "access_token": tokens.create_access_token(user),
+        "expires_in": tokens.ACCESS_TOKEN_TTL,
+    }, 200
+
+
 
 @bp.post("/update-password")
+# The new access token carries the whole profile
+@validate.require_auth("actualizar la contraseña", columns=tokens.PROFILE_CLAIMS)
 def update_password():
     """Update user password.
 
@@ -135,27 +241,14 @@ def update_password():
     Returns:
         200 OK: {
             "success": true, 
-            "message": "Contraseña actualizada correctamente"
+            "message": "Contraseña actualizada correctamente",
+            "access_token": "<jwt_token>" - Replaces the access tokens issued before the change,
+            "refresh_token": "<jwt_token>" - Replaces the refresh tokens issued before the change
         }
         400 Bad Request: {"success": false, "message": "La contraseña no puede estar vacía"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo actualizar la contraseña: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo actualizar la contraseña: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     data = request.json or {}
     new_pwd = data.get("password", "")
@@ -165,13 +258,28 @@ def update_password():
         return {"success": False, "message": "La contraseña no puede estar vacía"}, 400
     
     # Update user account password
-    update_password_result = db.update_user_password_by_id(user["id"], new_pwd)
+    try:
+        update_password_result = db.update_user_password_by_id(user["id"], new_pwd)
+    except password.Busy:
+        log.append(f"{datetime.now()} No se pudo actualizar la contraseña para el usuario {user['username']}: Servidor ocupado.")
+        return BUSY_RESPONSE
+
     if not update_password_result["success"]:
         log.append(f"{datetime.now()} No se pudo actualizar la contraseña para el usuario {user['username']}: {update_password_result['message']}")
         return update_password_result, 401
     log.append(f"{datetime.now()} La contraseña del usuario {user['username']} ha sido actualizada con éxito.")
+
+    # Tokens issued before the change are no longer accepted
+    user = {
+        **user,
+        "profile_version": update_password_result["profile_version"],
+        "credential_version": update_password_result["credential_version"],
+    }
+    tokens.record_profile_version(user["id"], user["profile_version"])
     
     return {
         "success": True,
-        "message": "Contraseña actualizada correctamente"
+        "message": "Contraseña actualizada correctamente",
+        "access_token": tokens.create_access_token(user),
+        "refresh_token": tokens.create_refresh_token(user),
     }, 200
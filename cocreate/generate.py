@@ -1,19 +1,350 @@
-from google import genai
-from pydantic import BaseModel
+import functools
+import itertools
+import json
+import math
 import os
-from flask import Blueprint, request
-from .utils import validate, db, log
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from flask import Blueprint, Response, g, request, url_for
+from .utils import validate, log, writer, llm, jobs, db, responsecache, singleflight, gateway, usage
+from . import generation_types
 from datetime import datetime
 
 bp = Blueprint("generate", __name__, url_prefix="/generate")
 
+# How often the job event stream checks the job, and for how long at most
+JOB_POLL_INTERVAL = int(os.getenv("JOB_POLL_INTERVAL_MS", 500)) / 1000
+JOB_EVENTS_TIMEOUT = int(os.getenv("JOB_EVENTS_TIMEOUT", 120))
+
+# Batch generation: items a batch may have, how many of them run at once,
+# and the threads shared by all batches of this process
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 16))
+
+_batch_executor = ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix="generation-batch")
+
+
+# Identical model calls in flight in this process, so duplicates share one call
+_in_flight = singleflight.Group()
+
+
+def _call_model(kind, user_id, priority, cache_key, contents):
+    response = gateway.call(
+        kind.name,
+        lambda timeout_ms: llm.get_client().models.generate_content(
+            model=kind.model, contents=contents, config=llm.with_timeout(kind.config, timeout_ms),
+        ),
+        user=user_id,
+        priority=priority,
+    )
+    usage.record_response(user_id, kind.name, response)
+    responsecache.set(cache_key, response.text)
+    return response.text
+
+
+def _generate(kind, user, data, priority="interactive"):
+    """
+    Generate a response of the given type.
+
+    Identical requests are answered from the response cache, and those
+    made while the first one is still waiting on the model share its call;
+    its tokens are counted for the user who made it. A fresh variant
+    (data["fresh"]) skips both and always calls the model. Views, batches and
+    asynchronous jobs share this function; the last two as "batch" priority.
+
+    Returns:
+        tuple: the response message and the text to store as a generation
+            (None when the type is not persisted)
+    """
+    contents = kind.contents(user, data)
+    cache_key = responsecache.key(kind.name, contents, kind.model, kind.schema_key)
+    usage.record(user["id"], kind.name, requests=1)
+
+    if data.get("fresh"):
+        # A fresh variant must not be the answer of an identical call in flight
+        text = _call_model(kind, user["id"], priority, cache_key, contents)
+    else:
+        text = responsecache.get(cache_key)
+        if text is None:
+            text = _in_flight.do(cache_key, _call_model, kind, user["id"], priority, cache_key, contents)
+
+    return kind.message(text), text if kind.persist else None
+
+
+for _kind in generation_types.TYPES.values():
+    jobs.register(_kind.name, functools.partial(_generate, _kind, priority="batch"))
+
+
+def _wants_stream():
+    """Whether the client asked for Server-Sent Events (?stream=1 or Accept: text/event-stream)."""
+    return request.args.get("stream") == "1" or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def _wants_fresh():
+    """Whether the client asked to skip the response cache (Cache-Control: no-cache)."""
+    return "no-cache" in request.headers.get("Cache-Control", "")
+
+
+def _wants_async():
+    """Whether the client asked for an asynchronous job (?async=1 or Prefer: respond-async)."""
+    return request.args.get("async") == "1" or "respond-async" in request.headers.get("Prefer", "")
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_stream(events):
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream(kind, user, data):
+    """
+    Stream a generation to the client as Server-Sent Events.
+
+    Sends a "chunk" event with the text of each chunk as the model produces
+    it, then a "done" event, or an "error" event if the model fails midway.
+    A cached response is sent as a single chunk. The complete text is
+    persisted once the stream finishes (if the type is persisted). If the
+    client disconnects first, the server closes the generator: the model
+    stream is abandoned and nothing is saved.
+    """
+    contents = kind.contents(user, data)
+    cache_key = responsecache.key(kind.name, contents, kind.model)
+    usage.record(user["id"], kind.name, requests=1)
+
+    def events():
+        text = None if data.get("fresh") else responsecache.get(cache_key)
+
+        if text is not None:
+            yield _event("chunk", {"text": text})
+        else:
+            parts = []
+            last = None
+            chunks = gateway.stream(
+                kind.name,
+                lambda timeout_ms: llm.get_client().models.generate_content_stream(
+                    model=kind.model, contents=contents, config=llm.with_timeout(None, timeout_ms),
+                ),
+                user=user["id"],
+            )
+
+            try:
+                for chunk in chunks:
+                    last = chunk
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield _event("chunk", {"text": chunk.text})
+            except Exception as e:
+                log.append(f"{datetime.now()} No se pudo {kind.action}: {str(e)}")
+                yield _event("error", {"success": False, "message": f"Ocurrió un error: {str(e)}"})
+                return
+            finally:
+                chunks.close()
+
+            # The last chunk carries the token counts of the whole response
+            usage.record_response(user["id"], kind.name, last)
+            text = "".join(parts)
+            responsecache.set(cache_key, text)
+
+        if kind.persist:
+            writer.submit(user["id"], kind.name, text)
+
+        log.append(f"{datetime.now()} El usuario {user['username']} {kind.done}.")
+
+        yield _event("done", {"success": True})
+
+    return _event_stream(events())
+
+
+def _enqueue(kind, user, data):
+    """Run a generation as an asynchronous job and answer 202 with its ID."""
+    try:
+        job_id = jobs.submit(user, kind.name, data)
+    except jobs.Busy:
+        log.append(f"{datetime.now()} No se pudo {kind.action}: Demasiados trabajos en curso.")
+        return (
+            {"success": False, "message": "El servidor está ocupado, inténtalo de nuevo en unos segundos"},
+            503,
+            {"Retry-After": "1"},
+        )
+    except RuntimeError as e:
+        # The job could not be stored
+        log.append(f"{datetime.now()} No se pudo {kind.action}: {str(e)}")
+        return {"success": False, "message": str(e)}, 500
+
+    log.append(f"{datetime.now()} El usuario {user['username']} encoló el trabajo {job_id} para {kind.action}.")
+
+    status_url = url_for("generate.get_job", job_id=job_id)
+    return (
+        {"success": True, "message": "Trabajo encolado", "job_id": job_id, "status_url": status_url},
+        202,
+        {"Location": status_url},
+    )
+
+
+def _unavailable(kind, e):
+    """Answer 503 when the model cannot take the call, telling the client when to retry."""
+    log.append(f"{datetime.now()} No se pudo {kind.action}: {str(e)}")
+    return (
+        {"success": False, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"},
+        503,
+        {"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+def _serve(generation_type):
+    """
+    Serve a generation request of any registered type.
+
+    Reads the type's fields from the JSON body, then runs the generation as
+    an asynchronous job, a stream or a plain request, as the client asked.
+    """
+    kind = generation_types.TYPES[generation_type]
+    user = g.principal
+
+    data = kind.read(request.get_json(silent=True) or {})
+    if data is None:
+        log.append(f"{datetime.now()} No se pudo {kind.action}: {kind.empty_message}.")
+        return {"success": False, "message": kind.empty_message}, 400
+
+    data["fresh"] = _wants_fresh()
+
+    if _wants_async():
+        return _enqueue(kind, user, data)
+
+    if kind.stream and _wants_stream():
+        retry_after = gateway.retry_after()
+        if retry_after:
+            return _unavailable(kind, gateway.Unavailable("El modelo no está disponible en este momento.", retry_after))
+        return _stream(kind, user, data)
+
+    try:
+        message, text = _generate(kind, user, data)
+    except gateway.Unavailable as e:
+        return _unavailable(kind, e)
+
+    if text is not None:
+        writer.submit(user["id"], kind.name, text)
+
+    log.append(f"{datetime.now()} El usuario {user['username']} {kind.done}.")
+
+    return {"success": True, "message": message}, 200
+
+
+def _read_batch_item(item, fresh):
+    """Return the generation type and data of a batch item, or None and the reason it is invalid."""
+    if not isinstance(item, dict):
+        return None, "Elemento inválido"
+
+    kind = generation_types.TYPES.get(str(item.get("type", "")).replace("-", "_"))
+    if kind is None:
+        return None, "Tipo de generación desconocido"
+
+    data = kind.read(item)
+    if data is None:
+        return None, kind.empty_message
+
+    data["fresh"] = fresh
+    return kind, data
+
+
+def _run_batch_item(kind, user, data):
+    try:
+        message, text = _generate(kind, user, data, priority="batch")
+    except Exception as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}, None
+
+    return {"success": True, "message": message}, text
+
+
+def _fan_out(user, items):
+    """
+    Run the valid items of a batch concurrently and yield them as they finish.
+
+    At most BATCH_CONCURRENCY items of the batch run at once. Items that
+    have not started are cancelled if the caller stops iterating.
+
+    Yields:
+        tuple: item index, result and the text to store (or None)
+    """
+    queued = iter(items)
+    pending = {}
+
+    try:
+        while True:
+            for index, kind, data in itertools.islice(queued, BATCH_CONCURRENCY - len(pending)):
+                pending[_batch_executor.submit(_run_batch_item, kind, user, data)] = index
+
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, text = future.result()
+                yield pending.pop(future), result, text
+
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _batch(body):
+    """
+    Validate a batch request.
+
+    Returns:
+        tuple: the results of invalid items by index and the (index, kind, data)
+            of the items to run, or None and an error response
+    """
+    items = body.get("items") if isinstance(body, dict) else None
+
+    if not isinstance(items, list) or not items:
+        return None, ({"success": False, "message": "La lista de elementos no puede estar vacía"}, 400)
+
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, ({"success": False, "message": f"Un lote admite como máximo {BATCH_MAX_ITEMS} elementos"}, 400)
+
+    fresh = _wants_fresh()
+    invalid = {}
+    valid = []
+
+    for index, item in enumerate(items):
+        kind, data = _read_batch_item(item, fresh)
+        if kind is None:
+            invalid[index] = {"index": index, "success": False, "message": data}
+        else:
+            valid.append((index, kind, data))
+
+    return (invalid, valid), None
+
+
+def _persist_batch(user, kinds, texts):
+    """Store the persisted results of a batch in one transaction."""
+    generations = [(user["id"], kinds[index].name, text) for index, text in texts.items() if text is not None]
+    if not generations:
+        return
+
+    result = db.create_generations(generations)
+    if not result["success"]:
+        log.append(f"{datetime.now()} No se pudo guardar el lote del usuario {user['username']}: {result['message']}")
+
 
 @bp.post("/video-script")
+@validate.require_auth("generar guion de video")
 def video_script():
     """Generate a video script based on the provided prompt and user parameters.
 
     Headers:
         Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Accept: text/event-stream - Optional. Stream the script as it is generated (same as ?stream=1)
+        Prefer: respond-async - Optional. Run as a background job (same as ?async=1)
+        Cache-Control: no-cache - Optional. Generate a fresh response instead of reusing a cached one
 
     Request Body:
         {
@@ -22,59 +353,26 @@ def video_script():
 
     Returns:
         200 OK: {"success": true, "message": "<generated script>"}
+        200 OK (stream): text/event-stream with "chunk" events ({"text": "<part>"}) and a final "done" or "error" event
+        202 Accepted (async): {"success": true, "job_id": "<id>", "status_url": "/generate/jobs/<id>"}
         400 Bad Request: {"success": false, "message": "El prompt no puede estar vacío"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        503 Service Unavailable: {"success": false, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"}
+            - With a Retry-After header
     """
-    client = genai.Client(api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"))
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo generar guion de video: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo generar guion de video: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    prompt = request.get_json()["prompt"]
-
-    if not prompt:
-        log.append(f"{datetime.now()} No se pudo generar guion de video: El prompt no puede estar vacío.")
-        return {"success": False, "message": "El prompt no puede estar vacío"}, 400
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=(
-            f"Genera un guion en español para un video sobre {prompt}. "
-            f"Este es mi tipo de contenido: {user.get('content_type')}. "
-            f"Este es mi publico objetivo: {user.get('target_audience')}. "
-            f"Este es el contexto adicional que quiero incluir: {user.get('additional_context')}. "
-            "Solo responde con el guion, estructuralo en parrafos con las timestamps correspondientes en formato (HH:MM:SS), "
-            "no uses emojis, ni texto innecesario."
-        ),
-    )
-
-    db.create_generation(user["id"], "video_script", response.text)
-
-    log.append(f"{datetime.now()} El usuario {user['username']} generó un guion de video.")
-
-    return {"success": True, "message": response.text}, 200
+    return _serve("video_script")
 
 
 @bp.post("/content-idea")
+@validate.require_auth("generar ideas de contenido")
 def content_idea():
     """Generate content ideas based on the provided prompt and user parameters.
 
     Headers:
         Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Accept: text/event-stream - Optional. Stream the ideas as they are generated (same as ?stream=1)
+        Prefer: respond-async - Optional. Run as a background job (same as ?async=1)
+        Cache-Control: no-cache - Optional. Generate a fresh response instead of reusing a cached one
 
     Request Body:
         {
@@ -83,59 +381,25 @@ def content_idea():
 
     Returns:
         200 OK: {"success": true, "message": "<generated ideas>"}
+        200 OK (stream): text/event-stream with "chunk" events ({"text": "<part>"}) and a final "done" or "error" event
+        202 Accepted (async): {"success": true, "job_id": "<id>", "status_url": "/generate/jobs/<id>"}
         400 Bad Request: {"success": false, "message": "El prompt no puede estar vacío"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        503 Service Unavailable: {"success": false, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"}
+            - With a Retry-After header
     """
-    client = genai.Client(api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"))
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo generar ideas de contenido: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo generar ideas de contenido: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    prompt = request.get_json()["prompt"]
-
-    if not prompt:
-        log.append(f"{datetime.now()} No se pudo generar ideas de contenido: El prompt no puede estar vacío.")
-        return {"success": False, "message": "El prompt no puede estar vacío"}, 400
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=(
-            f"Genera 5 ideas de contenido en español sobre {prompt}. "
-            f"Este es mi tipo de contenido: {user.get('content_type')}. "
-            f"Este es mi publico objetivo: {user.get('target_audience')}. "
-            f"Este es el contexto adicional que quiero incluir: {user.get('additional_context')}. "
-            "Por cada idea, incluye un título creativo y una breve descripción de qué podría incluir. "
-            "Enumera las ideas de 1 a 5."
-        ),
-    )
-
-    db.create_generation(user["id"], "content_idea", response.text)
-
-    log.append(f"{datetime.now()} El usuario {user['username']} generó ideas de contenido.")
-
-    return {"success": True, "message": response.text}, 200
+    return _serve("content_idea")
 
 
 @bp.post("/newsletter")
+@validate.require_auth("generar un newsletter")
 def newsletter():
     """Generate newsletter content based on the provided prompt and user parameters.
 
     Headers:
         Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Prefer: respond-async - Optional. Run as a background job (same as ?async=1)
+        Cache-Control: no-cache - Optional. Generate a fresh response instead of reusing a cached one
 
     Request Body:
         {
@@ -144,73 +408,24 @@ def newsletter():
 
     Returns:
         200 OK: {"success": true, "message": {"subject": "<subject>", "title": "<title>", "content": ["<section1>", "<section2>"]}}
+        202 Accepted (async): {"success": true, "job_id": "<id>", "status_url": "/generate/jobs/<id>"}
         400 Bad Request: {"success": false, "message": "El prompt no puede estar vacío"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        503 Service Unavailable: {"success": false, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"}
+            - With a Retry-After header
     """
-    client = genai.Client(api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"))
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo generar un newsletter: Token de autorización requerido.")
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo generar un newsletter: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    prompt = request.get_json()["prompt"]
-
-    if not prompt:
-        log.append(f"{datetime.now()} No se pudo generar un newsletter: El prompt no puede estar vacío.")
-        return {"success": False, "message": "El prompt no puede estar vacío"}, 400
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    class NewsletterResponse(BaseModel):
-        subject: str
-        title: str
-        content: list[str]
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=(
-            f"Genera el contenido para un newsletter en español sobre {prompt}. "
-            f"Este es mi tipo de contenido: {user.get('content_type')}. "
-            f"Este es mi publico objetivo: {user.get('target_audience')}. "
-            f"Este es el contexto adicional que quiero incluir: {user.get('additional_context')}. "
-            "El newsletter debe incluir un asunto atractivo, un titulo e introduccion, 2-3 secciones de contenido principal, y una conclusión con llamado a la acción."
-        ),
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": NewsletterResponse,
-        },
-    )
-
-    db.create_generation(user["id"], "newsletter", response.text)
-
-    log.append(f"{datetime.now()} El usuario {user['username']} generó un newsletter.")
-
-    return {
-        "success": True,
-        "message": {
-            "subject": response.parsed.subject,
-            "title": response.parsed.title,
-            "content": response.parsed.content,
-        },
-    }, 200
+    return _serve("newsletter")
 
 
 @bp.post("/thread")
+@validate.require_auth("generar un hilo de X")
 def thread():
     """Generate X (Twitter) thread content based on the provided prompt and user parameters.
 
     Headers:
         Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Prefer: respond-async - Optional. Run as a background job (same as ?async=1)
+        Cache-Control: no-cache - Optional. Generate a fresh response instead of reusing a cached one
 
     Request Body:
         {
@@ -219,64 +434,25 @@ def thread():
 
     Returns:
         200 OK: {"success": true, "message": "<generated thread content>"}
+        202 Accepted (async): {"success": true, "job_id": "<id>", "status_url": "/generate/jobs/<id>"}
         400 Bad Request: {"success": false, "message": "El prompt no puede estar vacío"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        503 Service Unavailable: {"success": false, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"}
+            - With a Retry-After header
     """
-    client = genai.Client(api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"))
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo generar un hilo de X: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo generar un hilo de X: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    prompt = request.get_json()["prompt"]
-
-    if not prompt:
-        log.append(f"{datetime.now()} No se pudo generar un hilo de X: El prompt no puede estar vacío.")
-        return {"success": False, "message": "El prompt no puede estar vacío"}, 400
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=(
-            f"Genera un hilo de X (anteriormente Twitter) en español sobre {prompt}. "
-            f"Este es mi tipo de contenido: {user.get('content_type')}. "
-            f"Este es mi publico objetivo: {user.get('target_audience')}. "
-            f"Este es el contexto adicional que quiero incluir: {user.get('additional_context')}. "
-            "El hilo debe tener entre 5 y 8 tweets, debes devolver cada uno en un array de strings. "
-            "Asegúrate que cada tweet sea conciso y no exceda los 280 caracteres. "
-            "El primer tweet debe captar la atención y el último debe incluir un llamado a la acción."
-        ),
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": list[str],
-        },
-    )
-
-    db.create_generation(user["id"], "thread", response.text)
-
-    log.append(f"{datetime.now()} El usuario {user['username']} generó un hilo de X.")
-
-    return {"success": True, "message": response.parsed}, 200
+    return _serve("thread")
 
 
 @bp.post("/change-tone")
+@validate.require_auth("cambiar el tono del texto")
 def change_tone():
     """Change the tone of provided text based on user parameters.
 
     Headers:
         Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Accept: text/event-stream - Optional. Stream the rewritten text as it is generated (same as ?stream=1)
+        Prefer: respond-async - Optional. Run as a background job (same as ?async=1)
+        Cache-Control: no-cache - Optional. Generate a fresh response instead of reusing a cached one
 
     Request Body:
         {
@@ -286,45 +462,196 @@ def change_tone():
 
     Returns:
         200 OK: {"success": true, "message": "<rewritten text>"}
+        200 OK (stream): text/event-stream with "chunk" events ({"text": "<part>"}) and a final "done" or "error" event
+        202 Accepted (async): {"success": true, "job_id": "<id>", "status_url": "/generate/jobs/<id>"}
         400 Bad Request: {"success": false, "message": "El texto no puede estar vacío"}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        503 Service Unavailable: {"success": false, "message": "El modelo no está disponible, inténtalo de nuevo más tarde"}
+            - With a Retry-After header
     """
-    client = genai.Client(api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"))
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo cambiar el tono del texto: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo cambiar el tono del texto: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-    
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    data = request.get_json()
-    text = data.get("text", "")
-    tone = data.get("tone", "profesional")
-
-    if not text:
-        log.append(f"{datetime.now()} No se pudo cambiar el tono del texto: El texto no puede estar vacío.")
-        return {"success": False, "message": "El texto no puede estar vacío"}, 400
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=(
-            f'Reescribe el siguiente texto en español con un tono {tone}: "{text}". '
-            "Mantén la intención y el mensaje principal, pero adapta el lenguaje y estilo para reflejar el tono solicitado. "
-            "Solo responde con el texto reescrito, sin explicaciones adicionales."
-        ),
-    )
+    return _serve("change_tone")
+
+
+@bp.post("/batch")
+@validate.require_auth("generar un lote")
+def batch():
+    """Generate several items of any type in one request, running them concurrently.
+
+    Headers:
+        Authorization: Bearer <jwt_token> - JWT token for user authentication
+        Accept: text/event-stream - Optional. Stream each result as it finishes (same as ?stream=1)
+        Cache-Control: no-cache - Optional. Generate fresh responses instead of reusing cached ones
+
+    Request Body:
+        {
+            "items": [
+                {
+                    "type": "string" - Required. "video_script", "content_idea", "newsletter", "thread" or "change_tone"
+                    "prompt": "string" - Required, except for "change_tone"
+                    "text": "string" - Required for "change_tone"
+                    "tone": "string" - Optional, for "change_tone" (defaults to "profesional")
+                }
+            ] - Required. At most BATCH_MAX_ITEMS items
+        }
+
+    Returns:
+        200 OK: {
+            "success": true,
+            "message": "Lote generado.",
+            "results": [{"index": int, "type": string, "success": bool, "message": ...}] - In request order;
+                an item that fails does not fail the rest
+        }
+        200 OK (stream): text/event-stream with an "item" event per result as it finishes, then a "done" event
+        400 Bad Request: {"success": false, "message": "La lista de elementos no puede estar vacía"}
+        401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+    """
+    principal = g.principal
+
+    parsed, error = _batch(request.get_json(silent=True))
+    if error is not None:
+        log.append(f"{datetime.now()} No se pudo generar un lote: {error[0]['message']}.")
+        return error
+
+    invalid, valid = parsed
+    # Worker threads get a plain copy of the profile, loaded once here
+    user = {field: principal.get(field) for field in jobs.PROFILE_FIELDS}
+    kinds = {index: kind for index, kind, _ in valid}
+    done_message = f"El usuario {user['username']} generó un lote de {len(invalid) + len(valid)} elementos."
+
+    if _wants_stream():
+        def events():
+            texts = {}
+
+            for result in invalid.values():
+                yield _event("item", result)
+
+            for index, result, text in _fan_out(user, valid):
+                texts[index] = text
+                yield _event("item", {"index": index, "type": kinds[index].name, **result})
+
+            _persist_batch(user, kinds, texts)
+            log.append(f"{datetime.now()} {done_message}")
+
+            yield _event("done", {"success": True})
+
+        return _event_stream(events())
+
+    results = dict(invalid)
+    texts = {}
+
+    for index, result, text in _fan_out(user, valid):
+        results[index] = {"index": index, "type": kinds[index].name, **result}
+        texts[index] = text
+
+    _persist_batch(user, kinds, texts)
+    log.append(f"{datetime.now()} {done_message}")
+
+    return {"success": True, "message": "Lote generado.", "results": [results[index] for index in sorted(results)]}, 200
+
+
+@bp.get("/status")
+@validate.require_auth("obtener el estado del modelo")
+def status():
+    """Get the load of the model calls of this process.
+
+    Headers:
+        Authorization: Bearer <jwt_token> - JWT token for user authentication
+
+    Returns:
+        200 OK: {
+            "success": true,
+            "message": "Estado del modelo.",
+            "gateway": {
+                "limit": int, "in_flight": int, "waiting": int - Calls running and queued for a slot
+                "types": {"<type>": {"limit": int, "in_flight": int, "waiting": int}},
+                "breaker": "closed" | "open" | "half_open",
+                "retries": int, "rejected": int - Since the process started
+            }
+        }
+        401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+    """
+    return {"success": True, "message": "Estado del modelo.", "gateway": gateway.stats()}, 200
+
+
+@bp.get("/jobs/<job_id>")
+@validate.require_auth("obtener el trabajo {job_id}")
+def get_job(job_id):
+    """Get the status of an asynchronous generation job, and its result once finished.
+
+    Headers:
+        Authorization: Bearer <jwt_token> - JWT token for user authentication
+
+    Returns:
+        200 OK: {
+            "success": true,
+            "message": "Trabajo encontrado.",
+            "job": {
+                "id": string,
+                "type": string,
+                "status": "queued" | "running" | "done" | "error",
+                "created_at": string,
+                "updated_at": string,
+                "result": {"success": bool, "message": ...} - Only once finished
+            }
+        }
+        401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        404 Not Found: {"success": false, "message": "No se encontró el trabajo."}
+    """
+    user = g.principal
+
+    job_result = db.get_job(user["id"], job_id)
+    if not job_result["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo obtener el trabajo {job_id}: {job_result['message']}")
+        return job_result, 404
+
+    return job_result, 200
+
+
+@bp.get("/jobs/<job_id>/events")
+@validate.require_auth("seguir el trabajo {job_id}")
+def job_events(job_id):
+    """Follow an asynchronous generation job as Server-Sent Events.
+
+    Headers:
+        Authorization: Bearer <jwt_token> - JWT token for user authentication
+
+    Returns:
+        200 OK: text/event-stream with a "status" event ({"job": {...}}) every time the
+            status changes, ending with a "done" or "error" event carrying the finished job.
+            The stream closes after JOB_EVENTS_TIMEOUT seconds; reconnect to keep following.
+        401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
+        404 Not Found: {"success": false, "message": "No se encontró el trabajo."}
+    """
+    user = g.principal
+
+    job_result = db.get_job(user["id"], job_id)
+    if not job_result["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo seguir el trabajo {job_id}: {job_result['message']}")
+        return job_result, 404
+
+    def events():
+        job = job_result["job"]
+        status = None
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+
+        while True:
+            if job["status"] in ("done", "error"):
+                yield _event(job["status"], {"job": job})
+                return
+
+            if job["status"] != status:
+                status = job["status"]
+                yield _event("status", {"job": job})
+
+            if time.monotonic() >= deadline:
+                return
+
+            time.sleep(JOB_POLL_INTERVAL)
 
-    log.append(f"{datetime.now()} El usuario {user['username']} cambió el tono de un texto.")
+            result = db.get_job(user["id"], job_id)
+            if not result["success"]:
+                yield _event("error", {"success": False, "message": result["message"]})
+                return
+            job = result["job"]
 
-    return {"success": True, "message": response.text}, 200
+    return _event_stream(events())
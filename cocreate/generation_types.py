@@ -0,0 +1,157 @@
+"""
+Registry of generation types.
+
+Each type declares its prompt template, the request fields it takes, the
+model, the response schema and whether its result is stored as a
+generation. Configs and schema adapters are built once at import, and
+generate.py serves every registered type through the same code path.
+"""
+from pydantic import BaseModel, TypeAdapter
+from google.genai import types
+from .utils import llm, responsecache
+
+# Part of the prompt that describes the user's profile
+PROFILE = (
+    "Este es mi tipo de contenido: {content_type}. "
+    "Este es mi publico objetivo: {target_audience}. "
+    "Este es el contexto adicional que quiero incluir: {additional_context}. "
+)
+PROFILE_FIELDS = ("content_type", "target_audience", "additional_context")
+
+
+class NewsletterResponse(BaseModel):
+    subject: str
+    title: str
+    content: list[str]
+
+
+class GenerationType:
+    """
+    A kind of generation served by /generate.
+
+    Args:
+        name: type stored with the generation and used as job type
+        template: prompt, formatted with the request fields and the user's profile
+        field: required request field
+        empty_message: message when the required field is empty
+        action: what the user tried to do, for log messages ("generar ...")
+        done: what the user did, for log messages ("generó ...")
+        defaults: optional request fields and their default values
+        schema: type of the JSON response, or None for plain text
+        model: model to use, defaults to llm.MODEL
+        persist: whether results are stored as generations
+        stream: whether the type can be streamed as Server-Sent Events
+    """
+
+    def __init__(self, name, template, field, empty_message, action, done,
+                 defaults=None, schema=None, model=None, persist=True, stream=True):
+        self.name = name
+        self.template = template
+        self.field = field
+        self.empty_message = empty_message
+        self.action = action
+        self.done = done
+        self.defaults = defaults or {}
+        self.model = model or llm.MODEL
+        self.persist = persist
+        self.stream = stream and schema is None
+
+        if schema is None:
+            self.config = None
+            self.schema_key = None
+            self._adapter = None
+        else:
+            self.config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+            self.schema_key = responsecache.schema_key(schema)
+            self._adapter = TypeAdapter(schema)
+
+    def read(self, body):
+        """Pick this type's fields from a request body, or return None if the required one is empty."""
+        if not body.get(self.field):
+            return None
+
+        data = {self.field: body[self.field]}
+        for field, default in self.defaults.items():
+            data[field] = body.get(field) or default
+        return data
+
+    def contents(self, user, data):
+        """Render the prompt for a user and the request data."""
+        values = {field: user.get(field) for field in PROFILE_FIELDS}
+        values.update(data)
+        return self.template.format_map(values)
+
+    def message(self, text):
+        """Turn the model's response into the message sent to the client."""
+        if self._adapter is None:
+            return text
+        return self._adapter.dump_python(self._adapter.validate_json(text))
+
+
+TYPES = {}
+
+
+def register(generation_type):
+    TYPES[generation_type.name] = generation_type
+
+
+register(GenerationType(
+    "video_script",
+    "Genera un guion en español para un video sobre {prompt}. " + PROFILE +
+    "Solo responde con el guion, estructuralo en parrafos con las timestamps correspondientes en formato (HH:MM:SS), "
+    "no uses emojis, ni texto innecesario.",
+    field="prompt",
+    empty_message="El prompt no puede estar vacío",
+    action="generar guion de video",
+    done="generó un guion de video",
+))
+
+register(GenerationType(
+    "content_idea",
+    "Genera 5 ideas de contenido en español sobre {prompt}. " + PROFILE +
+    "Por cada idea, incluye un título creativo y una breve descripción de qué podría incluir. "
+    "Enumera las ideas de 1 a 5.",
+    field="prompt",
+    empty_message="El prompt no puede estar vacío",
+    action="generar ideas de contenido",
+    done="generó ideas de contenido",
+))
+
+register(GenerationType(
+    "newsletter",
+    "Genera el contenido para un newsletter en español sobre {prompt}. " + PROFILE +
+    "El newsletter debe incluir un asunto atractivo, un titulo e introduccion, 2-3 secciones de contenido principal, "
+    "y una conclusión con llamado a la acción.",
+    field="prompt",
+    empty_message="El prompt no puede estar vacío",
+    action="generar un newsletter",
+    done="generó un newsletter",
+    schema=NewsletterResponse,
+))
+
+register(GenerationType(
+    "thread",
+    "Genera un hilo de X (anteriormente Twitter) en español sobre {prompt}. " + PROFILE +
+    "El hilo debe tener entre 5 y 8 tweets, debes devolver cada uno en un array de strings. "
+    "Asegúrate que cada tweet sea conciso y no exceda los 280 caracteres. "
+    "El primer tweet debe captar la atención y el último debe incluir un llamado a la acción.",
+    field="prompt",
+    empty_message="El prompt no puede estar vacío",
+    action="generar un hilo de X",
+    done="generó un hilo de X",
+    schema=list[str],
+))
+
+register(GenerationType(
+    "change_tone",
+    'Reescribe el siguiente texto en español con un tono {tone}: "{text}". '
+    "Mantén la intención y el mensaje principal, pero adapta el lenguaje y estilo para reflejar el tono solicitado. "
+    "Solo responde con el texto reescrito, sin explicaciones adicionales.",
+    field="text",
+    empty_message="El texto no puede estar vacío",
+    action="cambiar el tono del texto",
+    done="cambió el tono de un texto",
+    defaults={"tone": "profesional"},
+    # Rewritten texts are not stored as generations
+    persist=False,
+))
@@ -1,45 +1,119 @@
-from flask import Blueprint, request
-from .utils import validate, db, log
+from flask import Blueprint, g, request
+from .utils import validate, db, log, format
 from datetime import datetime
 
 bp = Blueprint("generations", __name__, url_prefix="/generations")
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# HTTP status for each failed favorites mutation result code
+FAVORITE_ERROR_STATUS = {"not_found": 404, "already_saved": 409, "not_saved": 404}
+
+
+def _pagination_args():
+    """Parse the limit, cursor, count and view query parameters of a listing request."""
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1 or limit > MAX_PAGE_SIZE:
+        return {"success": False, "message": f"El límite debe estar entre 1 y {MAX_PAGE_SIZE}"}
+
+    after_id = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        after_id = format.decode_cursor(cursor)
+        if after_id is None:
+            return {"success": False, "message": "Cursor inválido"}
+
+    with_total = request.args.get("count", "").lower() in ("1", "true")
+
+    view = request.args.get("view", "summary")
+    if view not in ("summary", "full"):
+        return {"success": False, "message": "La vista debe ser summary o full"}
+
+    return {
+        "success": True,
+        "limit": limit,
+        "after_id": after_id,
+        "with_total": with_total,
+        "summary": view == "summary",
+    }
+
+
+def _gen_id_arg():
+    """Read the gen_id of a favorites request body as a positive integer."""
+    generation_id = (request.get_json(silent=True) or {}).get("gen_id")
+    if not generation_id:
+        return {"success": False, "message": "ID de la generación requerido"}
+
+    # IDs are SQLite rowids: positive 64-bit integers, as numbers or digit strings
+    if isinstance(generation_id, bool) or not str(generation_id).isdigit() or not 0 < int(generation_id) < 2**63:
+        return {"success": False, "message": "ID de la generación inválido"}
+
+    return {"success": True, "gen_id": int(generation_id)}
+
+
+def _page_response(message, key, page):
+    """Build a listing response with the cursor of the next page."""
+    response = {
+        "success": True,
+        "message": message,
+        key: page["data"],
+        "next_cursor": None,
+    }
+
+    if page["next_after_id"] is not None:
+        response["next_cursor"] = format.encode_cursor(page["next_after_id"])
+
+    if "total" in page:
+        response["total"] = page["total"]
+
+    return response
+
 
 @bp.get("")
+@validate.require_auth("obtener generaciones")
 def get_generations():
-    """Retrieve all generations for the authenticated user.
+    """Retrieve a page of generations for the authenticated user.
     
     Request Headers:
         Authorization: Bearer <jwt_token> - Required. JWT token for authentication
+
+    Query Parameters:
+        limit: int - Optional. Page size, between 1 and 100 (defaults to 20)
+        cursor: string - Optional. The next_cursor returned by the previous page
+        count: bool - Optional. Include the total number of generations
+        view: string - Optional. "summary" (default) or "full" to include each content
         
+    Summaries contain id, type, created_at, preview and size. The full content
+    of a generation is available from GET /generations/<gen_id>.
+
     Returns:
         200 OK: {
             "success": true,
             "message": "Generaciones encontradas",
-            "generations": [array_of_generation_objects]
+            "generations": [array_of_generation_objects],
+            "next_cursor": string or null,
+            "total": int (only when count is requested)
         }
+        400 Bad Request: {"success": false, "message": error_message}
         401 Unauthorized: {"success": false, "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo obtener generaciones: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo obtener generaciones: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    generations = db.get_generations_by_user_id(user["id"])
-
-    if len(generations["data"]) == 0:
+    user = g.principal
+
+    pagination = _pagination_args()
+    if not pagination["success"]:
+        log.append(f"{datetime.now()} No se pudo obtener generaciones: {pagination['message']}.")
+        return pagination, 400
+
+    generations = db.get_generations_by_user_id(
+        user["id"],
+        pagination["limit"],
+        pagination["after_id"],
+        pagination["with_total"],
+        pagination["summary"],
+    )
+
+    if len(generations["data"]) == 0 and pagination["after_id"] is None:
         log.append(f"{datetime.now()} El usuario {user['username']} intentó obtener generaciones pero no se encontró ninguna.")
         return {
             "success": False,
@@ -48,14 +122,59 @@ def get_generations():
     
     log.append(f"{datetime.now()} El usuario {user['username']} obtuvo sus generaciones con éxito.")
 
+    return _page_response("Generaciones encontradas", "generations", generations)
+
+
+@bp.get("/search")
+@validate.require_auth("buscar generaciones")
+def search_generations():
+    """Full-text search over the authenticated user's generations.
+    
+    Request Headers:
+        Authorization: Bearer <jwt_token> - Required. JWT token for authentication
+
+    Query Parameters:
+        q: string - Required. The words to search for
+        type: string - Optional. Only return generations of this type
+        limit: int - Optional. Maximum number of results, between 1 and 100 (defaults to 20)
+        
+    Returns:
+        200 OK: {
+            "success": true,
+            "message": "Generaciones encontradas",
+            "results": [{"id", "type", "created_at", "snippet", "score"}]
+        }
+        400 Bad Request: {"success": false, "message": error_message}
+        401 Unauthorized: {"success": false, "message": error_message}
+        500 Server Error: {"success": false, "message": error_message}
+    """
+    user = g.principal
+
+    text = request.args.get("q", "").strip()
+    if not text:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo buscar generaciones: La búsqueda no puede estar vacía.")
+        return {"success": False, "message": "La búsqueda no puede estar vacía"}, 400
+
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1 or limit > MAX_PAGE_SIZE:
+        return {"success": False, "message": f"El límite debe estar entre 1 y {MAX_PAGE_SIZE}"}, 400
+
+    search_result = db.search_generations(user["id"], text, request.args.get("type"), limit)
+    if not search_result["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo buscar generaciones: {search_result['message']}")
+        return search_result, 500
+
+    log.append(f"{datetime.now()} El usuario {user['username']} buscó generaciones con éxito.")
+
     return {
         "success": True,
         "message": "Generaciones encontradas",
-        "generations": generations["data"],
-    }
+        "results": search_result["data"],
+    }, 200
 
 
 @bp.get("/<int:gen_id>")
+@validate.require_auth("obtener la generación {gen_id}")
 def get_generation_by_gen_id(gen_id):
     """Retrieve a generation for the authenticated user by its ID.
     
@@ -71,22 +190,7 @@ def get_generation_by_gen_id(gen_id):
         401 Unauthorized: {"success": false, "message": error_message}
         404 Not Found: {"success": false, "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo obtener la generación {gen_id}: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo obtener la generación {gen_id}: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     generation = db.get_generation_by_gen_id(user["id"], gen_id)
 
@@ -104,6 +208,7 @@ def get_generation_by_gen_id(gen_id):
 
 
 @bp.post("/save")
+@validate.require_auth("guardar una generación")
 def save_generation():
     """Save a generation for the authenticated user.
     
@@ -119,42 +224,32 @@ def save_generation():
         200 OK: {"success": true, "message": "La generación ha sido añadida a la lista de favoritos"}
         400 Bad Request: {"success": false, "message": error_message}
         401 Unauthorized: {"success": false, "message": error_message}
-        500 Server Error: {"success": false, "message": error_message}
+        404 Not Found: {"success": false, "code": "not_found", "message": error_message}
+        409 Conflict: {"success": false, "code": "already_saved", "message": error_message}
+        500 Server Error: {"success": false, "code": "error", "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo guardar una generación: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo guardar una: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     # Get generation ID from request
-    generation_id = request.json.get("gen_id")
-    if not generation_id:
-        log.append(f"{datetime.now()} El usuario {user['username']} no pudo guardar una generación: ID de la generación requerido.")
-        return {"success": False, "message": "ID de la generación requerido"}, 400
+    gen_id_arg = _gen_id_arg()
+    if not gen_id_arg["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo guardar una generación: {gen_id_arg['message']}.")
+        return gen_id_arg, 400
+    generation_id = gen_id_arg["gen_id"]
 
     # Save generation to database
     save_result = db.save_generation(user["id"], generation_id)
     if not save_result["success"]:
         log.append(f"{datetime.now()} El usuario {user['username']} no pudo guardar la generación {generation_id}: {save_result['message']}")
-        return {"success": False, "message": save_result["message"]}, 500
+        status = FAVORITE_ERROR_STATUS.get(save_result["code"], 500)
+        return {"success": False, "code": save_result["code"], "message": save_result["message"]}, status
     
     log.append(f"{datetime.now()} El usuario {user['username']} guardó la generación {generation_id} con éxito.")
 
     return {"success": True, "message": "La generación ha sido añadida a la lista de favoritos"}
 
 @bp.post("/unsave")
+@validate.require_auth("remover una generación")
 def unsave_generation():
     """Remove a saved generation for the authenticated user.
     
@@ -170,76 +265,70 @@ def unsave_generation():
         200 OK: {"success": true, "message": "La generación ha sido removida de la lista de favoritos"}
         400 Bad Request: {"success": false, "message": error_message}
         401 Unauthorized: {"success": false, "message": error_message}
-        500 Server Error: {"success": false, "message": error_message}
+        404 Not Found: {"success": false, "code": "not_saved", "message": error_message}
+        500 Server Error: {"success": false, "code": "error", "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo guardar una generación: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} Failed to unsave generation: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     # Get generation ID from request
-    generation_id = request.json.get("gen_id")
-    if not generation_id:
-        log.append(f"{datetime.now()} El usuario {user['username']} no pudo remover una generación: ID de la generación requerido.")
-        return {"success": False, "message": "ID de la generación requerido"}, 400
+    gen_id_arg = _gen_id_arg()
+    if not gen_id_arg["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo remover una generación: {gen_id_arg['message']}.")
+        return gen_id_arg, 400
+    generation_id = gen_id_arg["gen_id"]
 
     # Unsave generation from database
     unsave_result = db.unsave_generation(user["id"], generation_id)
     if not unsave_result["success"]:
         log.append(f"{datetime.now()} El usuario {user['username']} no pudo remover la generación {generation_id}: {unsave_result['message']}")
-        return {"success": False, "message": unsave_result["message"]}, 500
+        status = FAVORITE_ERROR_STATUS.get(unsave_result["code"], 500)
+        return {"success": False, "code": unsave_result["code"], "message": unsave_result["message"]}, status
     
     log.append(f"{datetime.now()} El usuario {user['username']} removió la generación {generation_id} con éxito.")
 
     return {"success": True, "message": "La generación ha sido removida de la lista de favoritos"}
 
 @bp.get("/saved")
+@validate.require_auth("obtener las generaciones guardadas")
 def get_saved_generations():
-    """Retrieve all saved generations for the authenticated user.
+    """Retrieve a page of saved generations for the authenticated user.
     
     Request Headers:
         Authorization: Bearer <jwt_token> - Required. JWT token for authentication
+
+    Query Parameters:
+        limit: int - Optional. Page size, between 1 and 100 (defaults to 20)
+        cursor: string - Optional. The next_cursor returned by the previous page
+        count: bool - Optional. Include the total number of saved generations
+        view: string - Optional. "summary" (default) or "full" to include each content
         
     Returns:
         200 OK: {
             "success": true,
             "message": "Generaciones favoritas encontradas",
-            "saved_generations": [array_of_saved_generation_objects]
+            "saved_generations": [array_of_saved_generation_objects],
+            "next_cursor": string or null,
+            "total": int (only when count is requested)
         }
+        400 Bad Request: {"success": false, "message": error_message}
         401 Unauthorized: {"success": false, "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo obtener las generaciones guardadas: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo obtener las generaciones guardadas: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
-
-    saved_generations = db.get_saved_generations_by_user_id(user["id"])
-
-    if len(saved_generations["data"]) == 0:
+    user = g.principal
+
+    pagination = _pagination_args()
+    if not pagination["success"]:
+        log.append(f"{datetime.now()} No se pudo obtener las generaciones guardadas: {pagination['message']}.")
+        return pagination, 400
+
+    saved_generations = db.get_saved_generations_by_user_id(
+        user["id"],
+        pagination["limit"],
+        pagination["after_id"],
+        pagination["with_total"],
+        pagination["summary"],
+    )
+
+    if len(saved_generations["data"]) == 0 and pagination["after_id"] is None:
         log.append(f"{datetime.now()} El usuario {user['username']} intentó obtener las generaciones guardadas pero no se encontró ninguna.")
         return {
             "success": False,
@@ -248,14 +337,11 @@ def get_saved_generations():
     
     log.append(f"{datetime.now()} El usuario {user['username']} obtuvo las generaciones guardadas con éxito.")
 
-    return {
-        "success": True,
-        "message": "Generaciones favoritas encontradas",
-        "saved_generations": saved_generations["data"],
-    }
+    return _page_response("Generaciones favoritas encontradas", "saved_generations", saved_generations)
 
 
 @bp.get("/export")
+@validate.require_auth("obtener generaciones")
 def export_generations():
     """Retrieve all generations for the authenticated user and export them to a JSON file.
     
@@ -273,22 +359,7 @@ def export_generations():
     """
     import os, json
 
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo obtener generaciones: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo obtener generaciones: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     generations = db.get_generations_by_user_id(user["id"])
 
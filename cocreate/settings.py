@@ -1,10 +1,18 @@
-from flask import Blueprint, request
-from .utils import db, validate, log
+from flask import Blueprint, g, request
+from .utils import db, validate, log, tokens
 from datetime import datetime
 
 bp = Blueprint("settings", __name__, url_prefix="/settings")
 
+
+def _reissue_access_token(user):
+    """Revoke the tokens carrying the old profile and issue one with the new profile."""
+    tokens.record_profile_version(user["id"], user["profile_version"])
+    return tokens.create_access_token(user)
+
+
 @bp.delete("/delete-account")
+@validate.require_auth("eliminar la cuenta")
 def delete_user():
     """
     Delete a user's account.
@@ -19,23 +27,7 @@ def delete_user():
         }
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
     """
-
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo eliminar la cuenta: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo eliminar la cuenta: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
     
     # Delete user account
     delete_result = db.delete_user(user["id"])
@@ -43,6 +35,8 @@ def delete_user():
         log.append(f"{datetime.now()} No se pudo eliminar la cuenta del usuario {user['username']}: {delete_result['message']}")
         return delete_result, 400
     
+    tokens.record_profile_version(user["id"], tokens.DELETED)
+
     log.append(f"{datetime.now()} Cuenta del usuario {user['username']} eliminada con éxito.")
 
     return {
@@ -51,6 +45,8 @@ def delete_user():
     }, 200
 
 @bp.post("/content-type")
+# The new access token carries the whole profile
+@validate.require_auth("actualizar el tipo de contenido", columns=tokens.PROFILE_CLAIMS)
 def update_content_type():
     """Update a user's content type preference.
     
@@ -65,24 +61,12 @@ def update_content_type():
     Returns:
         200 OK: {
             "success": true, 
-            "message": "Tipo de contenido actualizado con éxito"
+            "message": "Tipo de contenido actualizado con éxito",
+            "access_token": "<jwt_token>" - Carries the updated profile
         }
         400 Bad Request: {"success": false, "message": "El tipo de contenido no puede estar vacío" or error_message}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo actualizar el tipo de contenido: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo actualizar el tipo de contenido: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
 
     data = request.json or {}
     content_type = data.get("content_type", "")
@@ -91,8 +75,7 @@ def update_content_type():
         log.append(f"{datetime.now()} No se pudo actualizar el tipo de contenido: El tipo de contenido no puede estar vacío.")
         return {"success": False, "message": "El tipo de contenido no puede estar vacío"}, 400
 
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
     
     # Update user content type
     update_result = db.update_user_content_type(user["id"], content_type)
@@ -102,13 +85,18 @@ def update_content_type():
 
     log.append(f"{datetime.now()} Tipo de contenido del usuario {user['username']} actualizado a: {content_type}.")
 
+    user = {**user, "content_type": content_type, "profile_version": update_result["profile_version"]}
+
     return {
         "success": True,
         "message": "Tipo de contenido actualizado con éxito",
+        "access_token": _reissue_access_token(user),
     }, 200
 
 
 @bp.post("/target")
+# The new access token carries the whole profile
+@validate.require_auth("actualizar el público objetivo", columns=tokens.PROFILE_CLAIMS)
 def update_target_audience():
     """Update a user's target audience preference.
     
@@ -123,24 +111,12 @@ def update_target_audience():
     Returns:
         200 OK: {
             "success": true, 
-            "message": "Público objetivo actualizado con éxito"
+            "message": "Público objetivo actualizado con éxito",
+            "access_token": "<jwt_token>" - Carries the updated profile
         }
         400 Bad Request: {"success": false, "message": "El público objetivo no puede estar vacío" or error_message}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo actualizar el público objetivo: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo actualizar el público objetivo: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
 
     data = request.json or {}
     target_audience = data.get("target_audience", "")
@@ -149,8 +125,7 @@ def update_target_audience():
         log.append(f"{datetime.now()} No se pudo actualizar el público objetivo: El público objetivo no puede estar vacío.")
         return {"success": False, "message": "El público objetivo no puede estar vacío"}, 400
 
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
     
     # Update user target audience
     update_result = db.update_user_target_audience(user["id"], target_audience)
@@ -160,13 +135,18 @@ def update_target_audience():
     
     log.append(f"{datetime.now()} Público objetivo del usuario {user['username']} actualizado a: {target_audience}.")
 
+    user = {**user, "target_audience": target_audience, "profile_version": update_result["profile_version"]}
+
     return {
         "success": True,
         "message": "Público objetivo actualizado con éxito",
+        "access_token": _reissue_access_token(user),
     }, 200
 
 
 @bp.post("/additional-context")
+# The new access token carries the whole profile
+@validate.require_auth("actualizar el contexto adicional", columns=tokens.PROFILE_CLAIMS)
 def update_additional_context():
     """Update a user's additional context preference.
     
@@ -181,30 +161,17 @@ def update_additional_context():
     Returns:
         200 OK: {
             "success": true, 
-            "message": "Contexto adicional actualizado con éxito"
+            "message": "Contexto adicional actualizado con éxito",
+            "access_token": "<jwt_token>" - Carries the updated profile
         }
         400 Bad Request: {"success": false, "message": error_message}
         401 Unauthorized: {"success": false, "message": "Token de autorización requerido" or validation error}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo actualizar el contexto adicional: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo actualizar el contexto adicional: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
 
     data = request.json or {}
     additional_context = data.get("additional_context", "")
     
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
     
     # Update user additional context
     update_result = db.update_user_additional_context(user["id"], additional_context)
@@ -217,7 +184,10 @@ def update_additional_context():
     else:
         log.append(f"{datetime.now()} Contexto adicional del usuario {user['username']} vaciado.")
 
+    user = {**user, "additional_context": additional_context, "profile_version": update_result["profile_version"]}
+
     return {
         "success": True,
         "message": "Contexto adicional actualizado con éxito",
+        "access_token": _reissue_access_token(user),
     }, 200
\ No newline at end of file
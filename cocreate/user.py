@@ -1,10 +1,16 @@
-from flask import Blueprint, request
-from .utils import validate, log
-from datetime import datetime
+from flask import Blueprint, g, request
+from .utils import validate, log, db, format, usage
+from datetime import datetime, timedelta, timezone
 
 bp = Blueprint("user", __name__, url_prefix="/user")
 
+DEFAULT_USAGE_DAYS = 30
+MAX_USAGE_DAYS = 366
+
 @bp.get("")
+@validate.require_auth(
+    "obtener los datos del usuario", columns=("generations", "favorite_generations")
+)
 def get_user_data():
     """Get user profile data for the authenticated user.
     
@@ -27,22 +33,7 @@ def get_user_data():
         }
         401 Unauthorized: {"success": false, "message": error_message}
     """
-    # Get token from Authorization header
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        log.append(f"{datetime.now()} No se pudo obtener los datos del usuario: Token de autorización requerido.")
-        return {"success": False, "message": "Token de autorización requerido"}, 401
-
-    token = auth_header.split(" ")[1]
-
-    # Validate JWT token
-    validation_result = validate.validate_jwt(token)
-    if not validation_result["success"]:
-        log.append(f"{datetime.now()} No se pudo obtener los datos del usuario: {validation_result['message']}")
-        return {"success": False, "message": validation_result["message"]}, 401
-
-    # Extract user from validation result
-    user = validation_result["user"]
+    user = g.principal
 
     log.append(f"{datetime.now()} Datos del usuario {user['username']} obtenidos con éxito.")
     
@@ -50,4 +41,63 @@ def get_user_data():
         "success": True,
         "message": "Usuario encontrado",
         "user": user
-    }, 200
\ No newline at end of file
+    }, 200
+
+
+@bp.get("/usage")
+@validate.require_auth("obtener el consumo del usuario")
+def get_usage():
+    """Get the generation requests and model tokens used by the authenticated user.
+
+    Request Headers:
+        Authorization: "Bearer <jwt_token>" - Required. The JWT token for authentication
+
+    Query Parameters:
+        days: int - Optional. Number of days to include, today (UTC) included (default 30, max 366)
+
+    Returns:
+        200 OK: {
+            "success": true,
+            "message": "Consumo encontrado.",
+            "usage": [
+                {"day": "YYYY-MM-DD", "type": string, "requests": int, "prompt_tokens": int, "response_tokens": int}
+            ] - Newest day first,
+            "total": {"requests": int, "prompt_tokens": int, "response_tokens": int}
+        }
+        401 Unauthorized: {"success": false, "message": error_message}
+        500 Internal Server Error: {"success": false, "message": error_message}
+    """
+    user = g.principal
+
+    days = min(max(request.args.get("days", DEFAULT_USAGE_DAYS, type=int), 1), MAX_USAGE_DAYS)
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+    usage_result = db.get_usage(user["id"], since)
+    if not usage_result["success"]:
+        log.append(f"{datetime.now()} El usuario {user['username']} no pudo obtener su consumo: {usage_result['message']}")
+        return usage_result, 500
+
+    # Add the counts this worker has not flushed yet
+    totals = {}
+    for day, _type, *counts in usage_result["rows"] + usage.pending(user["id"]):
+        if day >= since:
+            row = totals.setdefault((day, _type), [0, 0, 0])
+            for i, count in enumerate(counts):
+                row[i] += count
+
+    rows = [(day, _type, *counts) for (day, _type), counts in sorted(totals.items())]
+    # Newest day first, types in order within a day (the sort is stable)
+    rows.sort(key=lambda row: row[0], reverse=True)
+
+    log.append(f"{datetime.now()} Consumo del usuario {user['username']} obtenido con éxito.")
+
+    return {
+        "success": True,
+        "message": "Consumo encontrado.",
+        "usage": format.usage_data(rows),
+        "total": {
+            "requests": sum(row[2] for row in rows),
+            "prompt_tokens": sum(row[3] for row in rows),
+            "response_tokens": sum(row[4] for row in rows),
+        },
+    }, 200
@@ -0,0 +1,56 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are stored as plain text; compressing them saves little
+MIN_SIZE = int(os.getenv("GENERATION_COMPRESSION_MIN_SIZE", 256))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+CODEC = os.getenv("GENERATION_CODEC", "zstd" if zstandard is not None else "zlib")
+if CODEC == "zstd" and zstandard is None:
+    CODEC = "zlib"
+
+
+def compress(text):
+    """
+    Compress a generation body with the configured codec.
+
+    Returns:
+        tuple: the value to store and the codec marker ("raw", "zlib" or "zstd")
+    """
+    data = text.encode("utf-8")
+
+    if len(data) < MIN_SIZE or CODEC == "raw":
+        return text, "raw"
+
+    if CODEC == "zstd":
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        compressed = zlib.compress(data, ZLIB_LEVEL)
+
+    # Keep incompressible bodies as text
+    if len(compressed) >= len(data):
+        return text, "raw"
+
+    return compressed, CODEC
+
+
+def decompress(value, codec):
+    """Return the text of a stored generation body given its codec marker."""
+    if codec is None or codec == "raw":
+        return value
+
+    if codec == "zlib":
+        return zlib.decompress(value).decode("utf-8")
+
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Se necesita el paquete zstandard para leer esta generación.")
+        return zstandard.ZstdDecompressor().decompress(value).decode("utf-8")
+
+    raise ValueError(f"Códec desconocido: {codec}")
@@ -1,66 +1,173 @@
+import atexit
+import json
+import os
+import queue
+import re
 import sqlite3
-import random
+import secrets
+import time
 from . import password
 from . import format
+from . import compression
+from . import migrations
+from . import cache
+
+DATABASE = os.getenv("DATABASE_PATH", "cocreate.db")
+
+# Connections are reused across requests instead of being opened per query.
+# At most POOL_SIZE idle connections are kept; extra ones are closed on release.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16 * 1024))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# The generation and favorite ID lists are aggregated as JSON arrays so user
+# rows keep the shape expected by format.user_data.
+USER_SELECT = """
+    SELECT id, username, content_type, target_audience, additional_context,
+        (SELECT json_group_array(id) FROM (SELECT id FROM generations WHERE user_id = users.id ORDER BY id)),
+        (SELECT json_group_array(generation_id) FROM favorites WHERE user_id = users.id),
+        profile_version, credential_version
+    FROM users"""
+
+# User IDs: milliseconds since 2025-01-01 UTC followed by random bits
+USER_ID_EPOCH_MS = 1735689600000
+USER_ID_RANDOM_BITS = 12
+USER_ID_ATTEMPTS = 5
+
+# Columns a request can load for its authenticated user (see get_user_columns),
+# by name. The ID lists are aggregated as JSON arrays like in USER_SELECT.
+USER_COLUMNS = {
+    "id": "id",
+    "username": "username",
+    "content_type": "content_type",
+    "target_audience": "target_audience",
+    "additional_context": "additional_context",
+    "generations": "(SELECT json_group_array(id) FROM (SELECT id FROM generations WHERE user_id = users.id ORDER BY id))",
+    "favorite_generations": "(SELECT json_group_array(generation_id) FROM favorites WHERE user_id = users.id)",
+    "profile_version": "profile_version",
+    "credential_version": "credential_version",
+}
+
+# Profile and password hash in one row, for login. The profile columns are
+# in the order expected by format.user_data.
+CREDENTIALS_SELECT = f"SELECT {', '.join(USER_COLUMNS.values())}, password FROM users"
+
+# Usernames recently looked up without a match. Kept briefly: a name
+# registered through another worker stays unknown here until it expires.
+UNKNOWN_USERNAME_CACHE_SIZE = int(os.getenv("UNKNOWN_USERNAME_CACHE_SIZE", 65536))
+UNKNOWN_USERNAME_CACHE_TTL = int(os.getenv("UNKNOWN_USERNAME_CACHE_TTL", 30))
+
+_unknown_usernames = cache.LRUCache(UNKNOWN_USERNAME_CACHE_SIZE, UNKNOWN_USERNAME_CACHE_TTL)
+
+GENERATION_COLUMNS = "generations.id, generations.type, generations.chat, generations.codec"
+SUMMARY_COLUMNS = "generations.id, generations.type, generations.created_at, generations.preview, generations.size"
+
+
+def _connect():
+    """Open a new connection to the database with the performance pragmas applied."""
+    conn = sqlite3.connect(DATABASE, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA foreign_keys = ON")
+    # Lets SQL (the full-text triggers) read compressed generation bodies
+    conn.create_function("decompress_chat", 2, compression.decompress, deterministic=True)
+    return conn
+
+
+def get_connection():
+    """Take a connection from the pool, opening a new one if none is idle."""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+
+def release_connection(conn):
+    """Return a connection to the pool, rolling back any uncommitted transaction."""
+    if conn.in_transaction:
+        conn.rollback()
+
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_connections():
+    """Close every idle connection in the pool."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+
+atexit.register(close_connections)
+
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's connections. They are kept
+    # referenced rather than closed: closing them here would release the
+    # parent's file locks on the database.
+    global _pool
+
+    _inherited_pools.append(_pool)
+    _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+_inherited_pools = []
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def create_database() -> None:
-    conn = sqlite3.connect("cocreate.db")
-    cursor = conn.cursor()
+    """Bring the database schema up to date by applying pending migrations."""
+    conn = get_connection()
 
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            content_type TEXT,
-            target_audience TEXT,
-            additional_context TEXT,
-            generations TEXT,
-            favorite_generations TEXT
-        )
+    try:
+        migrations.migrate(conn)
+    finally:
+        release_connection(conn)
+
+
+def run_backfills(batch_size=500, pause=0.05) -> None:
     """
-    )
+    Run the online data backfills to completion, in small batches.
 
-    # Generations table creation
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS generations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            chat TEXT NOT NULL
-        )
+    Each batch is its own short transaction and the loop sleeps between
+    batches, so it can run in the background without starving writers.
     """
-    )
+    for backfill in migrations.BACKFILLS:
+        last_id = 0
 
-    cursor.close()
-    conn.commit()
-    conn.close()
+        while last_id is not None:
+            conn = get_connection()
+            try:
+                last_id = migrations.backfill_batch(conn, backfill, last_id, batch_size)
+            finally:
+                release_connection(conn)
 
+            time.sleep(pause)
 
-def generate_unique_user_id() -> int:
+
+def generate_user_id() -> int:
     """
-    Recursively generate a unique user ID.
-    If the generated ID already exists, the function calls itself again.
+    Generate a time-ordered, non-sequential user ID without touching the database.
+
+    The high bits hold the milliseconds since USER_ID_EPOCH_MS and the low
+    USER_ID_RANDOM_BITS bits are random, so IDs cannot be enumerated and
+    two registrations only collide if they land on the same millisecond and
+    draw the same random bits. IDs fit in 53 bits so JavaScript clients can
+    represent them exactly.
     """
-    conn = sqlite3.connect("cocreate.db")
-    cursor = conn.cursor()
-    
-    try:
-        generated_id = random.randint(1000, 999999)
-        
-        cursor.execute("SELECT id FROM users WHERE id = ?", (generated_id,))
-        existing_user = cursor.fetchone()
-        
-        if existing_user is None:
-            return generated_id
-        else:
-            return generate_unique_user_id()
-            
-    finally:
-        cursor.close()
-        conn.close()
+    millis = int(time.time() * 1000) - USER_ID_EPOCH_MS
+    return (millis << USER_ID_RANDOM_BITS) | secrets.randbits(USER_ID_RANDOM_BITS)
 
 
 def create_user(
@@ -70,33 +177,45 @@ def create_user(
     _target_audience="",
     _additional_context="",
 ):
-    conn = sqlite3.connect("cocreate.db")
+    # Hashed before taking a connection, which would sit idle meanwhile.
+    # Raises password.Busy when the hashing pool is saturated.
+    password_hash = password.hash(_password)
+
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        user_id = generate_unique_user_id()
-        
-        password_hash = password.hash(_password)
         formatted_username = _username.lower()
 
-        cursor.execute(
-            """
-            INSERT INTO users (id, username, password, content_type, target_audience, additional_context, generations, favorite_generations)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                user_id,
-                formatted_username,
-                password_hash,
-                _content_type,
-                _target_audience,
-                _additional_context,
-                "[]",
-                "[]",
-            ),
-        )
+        # The insert itself detects ID collisions, so no lookup is needed first
+        for _ in range(USER_ID_ATTEMPTS):
+            user_id = generate_user_id()
+
+            try:
+                cursor.execute(
+                    """
+                    INSERT INTO users (id, username, password, content_type, target_audience, additional_context)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        user_id,
+                        formatted_username,
+                        password_hash,
+                        _content_type,
+                        _target_audience,
+                        _additional_context,
+                    ),
+                )
+                break
+            except sqlite3.IntegrityError as e:
+                if "users.id" not in str(e):
+                    raise
+        else:
+            return {"success": False, "message": "No se pudo asignar un ID al usuario."}
 
         conn.commit()
+        _unknown_usernames.invalidate(formatted_username)
+
         return {
             "success": True,
             "message": f"Usuario {formatted_username} creado.",
@@ -109,16 +228,16 @@ def create_user(
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 def get_user_by_id(id):
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         user = cursor.execute(
-            "SELECT id, username, content_type, target_audience, additional_context, generations, favorite_generations FROM users WHERE id = ?",
+            USER_SELECT + " WHERE id = ?",
             [str(id)],
         ).fetchone()
 
@@ -136,16 +255,47 @@ def get_user_by_id(id):
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
+
+def get_user_columns(user_id, columns):
+    """
+    Load only the given user columns (keys of USER_COLUMNS).
+
+    Returns:
+        dict: the column values by name, or None if the user does not exist
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        row = cursor.execute(
+            f"SELECT {', '.join(USER_COLUMNS[column] for column in columns)} FROM users WHERE id = ?",
+            [str(user_id)],
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        values = dict(zip(columns, row))
+        for column in ("generations", "favorite_generations"):
+            if column in values:
+                values[column] = json.loads(values[column])
+
+        return values
+
+    finally:
+        cursor.close()
+        release_connection(conn)
 
 
 def get_user_by_username(username):
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         user = cursor.execute(
-            "SELECT id, username, content_type, target_audience, additional_context, generations, favorite_generations FROM users WHERE username = ?",
+            USER_SELECT + " WHERE username = ?",
             [username],
         ).fetchone()
 
@@ -163,51 +313,81 @@ def get_user_by_username(username):
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
 
+def get_credentials_by_username(username):
+    """
+    Fetch a user's profile and password hash in a single query, for login.
 
-def get_user_password_by_id(id):
-    conn = sqlite3.connect("cocreate.db")
+    Usernames without a match are remembered for UNKNOWN_USERNAME_CACHE_TTL
+    seconds, so repeated attempts with them do not reach the database.
+    """
+    if _unknown_usernames.get(username):
+        return {"success": False, "message": "No se encontró el usuario."}
+
+    conn = get_connection()
     cursor = conn.cursor()
 
-    password = cursor.execute(
-        "SELECT password FROM users WHERE id = ?", [str(id)]
-    ).fetchone()
+    try:
+        row = cursor.execute(
+            CREDENTIALS_SELECT + " WHERE username = ?",
+            [username],
+        ).fetchone()
 
-    cursor.close()
-    conn.commit()
-    conn.close()
+        if row is None:
+            _unknown_usernames.set(username, True)
+            return {"success": False, "message": "No se encontró el usuario."}
+
+        return {
+            "success": True,
+            "message": "Usuario encontrado.",
+            "user": format.user_data(row),
+            "password": row[-1],
+        }
+
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def unknown_username_cache_stats():
+    """Hit, miss and eviction counters of the unknown username cache."""
+    return _unknown_usernames.stats()
 
-    return password[0]
 
 def update_user_password_by_id(user_id, new_password):
-    conn = sqlite3.connect("cocreate.db")
+    # Raises password.Busy when the hashing pool is saturated
+    password_hash = password.hash(new_password)
+
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        password_hash = password.hash(new_password)
-
         cursor.execute(
             """
             UPDATE users
-            SET password = ?
+            SET password = ?, profile_version = profile_version + 1, credential_version = credential_version + 1
             WHERE id = ?
+            RETURNING profile_version, credential_version
             """,
             (password_hash, str(user_id)),
         )
 
-        if cursor.rowcount == 0:
+        updated = cursor.fetchone()
+        if updated is None:
             return {"success": False, "message": "Usuario no encontrado."}
         
         conn.commit()
 
-        user = cursor.execute(
-            "SELECT * FROM users WHERE id = ?", [str(user_id)]
-        ).fetchone()
-
         return {
             "success": True,
-            "message": "Contraseña actualizada con éxito."
+            "message": "Contraseña actualizada con éxito.",
+            "profile_version": updated[0],
+            "credential_version": updated[1],
         }
         
     except sqlite3.Error as e:
@@ -215,99 +395,131 @@ def update_user_password_by_id(user_id, new_password):
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
+
+def rehash_user_password(user_id, old_hash, new_hash):
+    """
+    Replace a password hash with one of the same password at the current
+    work factor. Unlike a password change, it keeps the user's tokens valid.
+    Nothing is written if the password changed since old_hash was read.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+            (new_hash, str(user_id), old_hash),
+        )
+        conn.commit()
+
+        return {"success": cursor.rowcount == 1, "message": "Hash de la contraseña actualizado."}
+
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
 
 
 def update_user_content_type(user_id, content_type):
     """Update a user's content type preference."""
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute(
             """
             UPDATE users
-            SET content_type = ?
+            SET content_type = ?, profile_version = profile_version + 1
             WHERE id = ?
+            RETURNING profile_version
             """,
             (content_type, str(user_id)),
         )
 
-        if cursor.rowcount == 0:
+        updated = cursor.fetchone()
+        if updated is None:
             return {"success": False, "message": "No se encontró el usuario."}
 
         conn.commit()
-        return {"success": True, "message": "Tipo de contenido actualizado con éxito."}
+        return {"success": True, "message": "Tipo de contenido actualizado con éxito.", "profile_version": updated[0]}
 
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 def update_user_target_audience(user_id, target_audience):
     """Update a user's target audience preference."""
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute(
             """
             UPDATE users
-            SET target_audience = ?
+            SET target_audience = ?, profile_version = profile_version + 1
             WHERE id = ?
+            RETURNING profile_version
             """,
             (target_audience, str(user_id)),
         )
 
-        if cursor.rowcount == 0:
+        updated = cursor.fetchone()
+        if updated is None:
             return {"success": False, "message": "No se encontró el usuario."}
 
         conn.commit()
-        return {"success": True, "message": "Público objetivo actualizado con éxito."}
+        return {"success": True, "message": "Público objetivo actualizado con éxito.", "profile_version": updated[0]}
 
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 def update_user_additional_context(user_id, additional_context):
     """Update a user's additional context."""
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute(
             """
             UPDATE users
-            SET additional_context = ?
+            SET additional_context = ?, profile_version = profile_version + 1
             WHERE id = ?
+            RETURNING profile_version
             """,
             (additional_context, str(user_id)),
         )
 
-        if cursor.rowcount == 0:
+        updated = cursor.fetchone()
+        if updated is None:
             return {"success": False, "message": "No se encontró el usuario."}
 
         conn.commit()
-        return {"success": True, "message": "Contexto adicional actualizado correctamente."}
+        return {"success": True, "message": "Contexto adicional actualizado correctamente.", "profile_version": updated[0]}
 
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 def delete_user(user_id):
     """Delete a user from the database."""
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
@@ -330,89 +542,160 @@ def delete_user(user_id):
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
+
+GENERATION_INSERT = """
+    INSERT INTO generations (type, chat, codec, user_id, preview, size, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+
+def _generation_row(_id, _type, _chat):
+    """Build the generations row for a new body: compressed, with its preview and size."""
+    chat, codec = compression.compress(_chat)
+    return (_type, chat, codec, _id, format.generation_preview(_type, _chat), len(_chat.encode("utf-8")))
 
 
 def create_generation(_id=0, _type="unknown", _chat=""):
     if _id == 0:
         return
 
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        user = get_user_by_id(_id)["user"]
+        cursor.execute(GENERATION_INSERT, _generation_row(_id, _type, _chat))
 
-        user_generations = user["generations"]
+        conn.commit()
 
-        cursor.execute(
-            "INSERT INTO generations (type, chat) VALUES (?, ?)", [_type, _chat]
-        )
+        return {"success": True, "message": f"Generación guardada."}
 
-        gen_id = cursor.lastrowid
+    except sqlite3.IntegrityError:
+        return {"success": False, "message": "La generación ya existe."}
 
-        user_generations.append(gen_id)
+    finally:
+        cursor.close()
+        release_connection(conn)
 
-        gen_string = "["
-        for i in range(0, len(user_generations)):
-            if i == len(user_generations) - 1:
-                gen_string += str(user_generations[i])
-            else:
-                gen_string += str(user_generations[i]) + ", "
 
-        gen_string += "]"
+def create_generations(generations):
+    """
+    Insert several generations in a single transaction.
 
-        cursor.execute(
-            "UPDATE users SET generations = ? WHERE id = ?", [gen_string, _id]
+    Args:
+        generations (list): (user_id, type, chat) tuples
+
+    Returns:
+        dict: success status and the number of generations inserted
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(
+            GENERATION_INSERT,
+            [_generation_row(_id, _type, _chat) for _id, _type, _chat in generations],
         )
 
         conn.commit()
 
-        return {"success": True, "message": f"Generación guardada."}
+        return {"success": True, "message": "Generaciones guardadas.", "count": len(generations)}
 
-    except sqlite3.IntegrityError:
-        return {"success": False, "message": "La generación ya existe."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
-def get_generations_by_user_id(user_id):
-    conn = sqlite3.connect("cocreate.db")
+def _generation_page(source, key, count_query, user_id, limit, after_id, with_total, summary):
+    """
+    Fetch one page of a listing of generations, for the get_*_by_user_id functions.
+
+    Args:
+        source (str): FROM and WHERE clauses selecting the user's rows, with
+            the user ID as their only parameter
+        key (str): column the listing is ordered and paginated by
+        count_query (str): query counting every row of the listing, with the
+            user ID as its only parameter
+    """
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        generations = cursor.execute(
-            "SELECT * FROM generations WHERE id IN (SELECT json_each.value FROM users, json_each(generations) WHERE users.id = ?)",
-            [str(user_id)],
-        ).fetchall()
+        columns = SUMMARY_COLUMNS if summary else GENERATION_COLUMNS
+        query = f"SELECT {columns} FROM {source}"
+        params = [user_id]
 
-        if generations is None:
-            return {"success": False, "message": "No se encontraron generaciones."}
+        if after_id is not None:
+            query += f" AND {key} > ?"
+            params.append(after_id)
 
-        return {
+        query += f" ORDER BY {key}"
+
+        # Fetch one extra row to know whether another page follows
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        generations = cursor.execute(query, params).fetchall()
+
+        result = {
             "success": True,
             "message": "Generaciones encontradas.",
-            "data": format.generation_data(generations),
+            "next_after_id": None,
         }
 
+        if limit is not None and len(generations) > limit:
+            generations = generations[:limit]
+            result["next_after_id"] = generations[-1][0]
+
+        if summary:
+            result["data"] = format.generation_summary_data(generations)
+        else:
+            result["data"] = format.generation_data(generations)
+
+        if with_total:
+            result["total"] = cursor.execute(count_query, [user_id]).fetchone()[0]
+
+        return result
+
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
+
+def get_generations_by_user_id(user_id, limit=None, after_id=None, with_total=False, summary=False):
+    """
+    Fetch a user's generations ordered by ID.
+
+    When a limit is given, only generations with an ID greater than after_id
+    are returned (keyset pagination) and "next_after_id" holds the ID to
+    continue from, or None on the last page. "total" is only counted when
+    with_total is set. With summary set, rows carry the preview and size
+    instead of the full content, which is never read from disk.
+    """
+    return _generation_page(
+        "generations WHERE user_id = ?",
+        "id",
+        "SELECT COUNT(*) FROM generations WHERE user_id = ?",
+        user_id, limit, after_id, with_total, summary,
+    )
 
 
 def get_generation_by_gen_id(user_id, gen_id):
-    conn = sqlite3.connect("cocreate.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
         generation = cursor.execute(
-            "SELECT * FROM generations WHERE id IN (SELECT json_each.value FROM users, json_each(generations) WHERE users.id = ?) AND id = ?",
-            [str(user_id), str(gen_id)],
+            f"SELECT {GENERATION_COLUMNS} FROM generations WHERE id = ? AND user_id = ?",
+            [gen_id, user_id],
         ).fetchone()
 
         if generation is None:
@@ -429,115 +712,465 @@ def get_generation_by_gen_id(user_id, gen_id):
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
-def save_generation(user_id, generation_id):
-    conn = sqlite3.connect("cocreate.db")
+def _fts_query(text):
+    """Turn free text into an FTS5 query that matches every word, ignoring FTS syntax."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+
+    # Quote each word so user input is never parsed as FTS operators
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_generations(user_id, text, generation_type=None, limit=20):
+    """
+    Full-text search over a user's generations, best matches first.
+
+    Each result carries an HTML-escaped snippet of the matching content
+    with the matched terms wrapped in <mark> tags.
+    """
+    query = _fts_query(text)
+    if query is None:
+        return {"success": True, "message": "Generaciones encontradas.", "data": []}
+
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        user = get_user_by_id(user_id)["user"]
+        sql = """
+            SELECT generations.id, generations.type, generations.created_at,
+                snippet(generations_fts, 0, ?, ?, '…', 16),
+                bm25(generations_fts)
+            FROM generations_fts JOIN generations ON generations.id = generations_fts.rowid
+            WHERE generations_fts MATCH ? AND generations.user_id = ?
+        """
+        params = [format.SNIPPET_START, format.SNIPPET_END, query, user_id]
+
+        if generation_type:
+            sql += " AND generations.type = ?"
+            params.append(generation_type)
+
+        sql += " ORDER BY bm25(generations_fts) LIMIT ?"
+        params.append(limit)
 
-        user_generations = user["generations"]
-        user_saved_generations = user["favorite_generations"]
+        results = cursor.execute(sql, params).fetchall()
 
-        if int(generation_id) in user_saved_generations:
-            return {"success": False, "message": "La generación ya está en la lista de favoritos."}
+        return {
+            "success": True,
+            "message": "Generaciones encontradas.",
+            "data": format.search_result_data(results),
+        }
 
-        if int(generation_id) not in user_generations:
-            return {"success": False, "message": "No se encontró la generación."}
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
-        user_saved_generations.append(int(generation_id))
+    finally:
+        cursor.close()
+        release_connection(conn)
 
-        gen_string = "["
-        for i in range(0, len(user_saved_generations)):
-            if i == len(user_saved_generations) - 1:
-                gen_string += str(user_saved_generations[i])
-            else:
-                gen_string += str(user_saved_generations[i]) + ", "
 
-        gen_string += "]"
+def save_generation(user_id, generation_id):
+    """
+    Add one of the user's generations to their favorites in a single statement.
 
+    The result "code" is "saved", "already_saved", "not_found" or "error".
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Only inserts if the generation belongs to the user; duplicates are ignored
         cursor.execute(
-            "UPDATE users SET favorite_generations = ? WHERE id = ?",
-            [gen_string, user_id],
+            """
+            INSERT INTO favorites (user_id, generation_id)
+            SELECT user_id, id FROM generations WHERE id = ? AND user_id = ?
+            ON CONFLICT (user_id, generation_id) DO NOTHING
+            """,
+            [int(generation_id), user_id],
         )
 
-        conn.commit()
+        if cursor.rowcount == 1:
+            conn.commit()
+            return {"success": True, "code": "saved", "message": f"Generación añadida a la lista de favoritos."}
 
-        return {"success": True, "message": f"Generación añadida a la lista de favoritos."}
+        # Nothing was inserted; tell apart a duplicate from a missing generation
+        owned = cursor.execute(
+            "SELECT 1 FROM generations WHERE id = ? AND user_id = ?",
+            [int(generation_id), user_id],
+        ).fetchone()
 
-    except sqlite3.IntegrityError:
-        return {"success": False, "message": "La generación ya existe."}
+        if owned is None:
+            return {"success": False, "code": "not_found", "message": "No se encontró la generación."}
+
+        return {"success": False, "code": "already_saved", "message": "La generación ya está en la lista de favoritos."}
+
+    except sqlite3.Error as e:
+        return {"success": False, "code": "error", "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
 def unsave_generation(user_id, generation_id):
-    conn = sqlite3.connect("cocreate.db")
+    """
+    Remove a generation from the user's favorites in a single statement.
+
+    The result "code" is "removed", "not_saved" or "error".
+    """
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        user = get_user_by_id(user_id)["user"]
+        cursor.execute(
+            "DELETE FROM favorites WHERE user_id = ? AND generation_id = ?",
+            [user_id, int(generation_id)],
+        )
+
+        if cursor.rowcount == 0:
+            return {"success": False, "code": "not_saved", "message": "No se encontró la generación en la lista de favoritos."}
+
+        conn.commit()
+
+        return {"success": True, "code": "removed", "message": f"Generación removida de la lista de favoritos."}
 
-        user_saved_generations = user["favorite_generations"]
+    except sqlite3.Error as e:
+        return {"success": False, "code": "error", "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
 
-        if int(generation_id) not in user_saved_generations:
-            return {"success": False, "message": "No se encontró la generación en la lista de favoritos."}
 
-        user_saved_generations.remove(int(generation_id))
+def get_saved_generations_by_user_id(user_id, limit=None, after_id=None, with_total=False, summary=False):
+    """
+    Fetch a user's saved generations ordered by ID, paginated and projected
+    the same way as get_generations_by_user_id.
+    """
+    # Summaries are answered from the covering listing index alone
+    generations = "generations INDEXED BY idx_generations_listing" if summary else "generations"
+
+    return _generation_page(
+        f"""favorites JOIN {generations}
+            ON generations.user_id = favorites.user_id AND generations.id = favorites.generation_id
+        WHERE favorites.user_id = ?""",
+        "favorites.generation_id",
+        "SELECT COUNT(*) FROM favorites WHERE user_id = ?",
+        user_id, limit, after_id, with_total, summary,
+    )
 
-        gen_string = "["
-        for i in range(0, len(user_saved_generations)):
-            if i == len(user_saved_generations) - 1:
-                gen_string += str(user_saved_generations[i])
-            else:
-                gen_string += str(user_saved_generations[i]) + ", "
 
-        gen_string += "]"
+def create_job(job_id, user_id, job_type, payload):
+    """Store a queued generation job. payload is JSON-serializable."""
+    conn = get_connection()
+    cursor = conn.cursor()
 
+    try:
         cursor.execute(
-            "UPDATE users SET favorite_generations = ? WHERE id = ?",
-            [gen_string, user_id],
+            "INSERT INTO jobs (id, user_id, type, payload) VALUES (?, ?, ?, ?)",
+            (job_id, user_id, job_type, json.dumps(payload)),
         )
+        conn.commit()
+
+        return {"success": True, "message": "Trabajo encolado."}
 
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def claim_job(job_id):
+    """
+    Mark a queued job as running.
+
+    Only one worker can claim a job, so it runs once even if several
+    workers try to resume it at the same time.
+
+    Returns:
+        dict: the job's user_id, type and payload, or None if it was not queued
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        row = cursor.execute(
+            """
+            UPDATE jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+            RETURNING user_id, type, payload
+            """,
+            [job_id],
+        ).fetchone()
         conn.commit()
 
-        return {"success": True, "message": f"Generación removida de la lista de favoritos."}
+        if row is None:
+            return None
+
+        return {"user_id": row[0], "type": row[1], "payload": json.loads(row[2])}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def finish_job(job_id, status, result, generation=None):
+    """
+    Record a job's outcome and, in the same transaction, store its generation.
+
+    Args:
+        status (str): "done" or "error"
+        result (dict): JSON-serializable response returned to the client
+        generation (tuple): optional (user_id, type, chat) to persist
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        if generation is not None:
+            cursor.execute(GENERATION_INSERT, _generation_row(*generation))
+
+        cursor.execute(
+            "UPDATE jobs SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, json.dumps(result), job_id),
+        )
+        conn.commit()
+
+        return {"success": True, "message": "Trabajo finalizado."}
 
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 
-def get_saved_generations_by_user_id(user_id):
-    conn = sqlite3.connect("cocreate.db")
+def get_job(user_id, job_id):
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        generations = cursor.execute(
-            "SELECT * FROM generations WHERE id IN (SELECT json_each.value FROM users, json_each(favorite_generations) WHERE users.id = ?)",
-            [str(user_id)],
+        row = cursor.execute(
+            """
+            SELECT id, type, status, result, created_at, updated_at FROM jobs
+            WHERE id = ? AND user_id = ?
+            """,
+            [job_id, user_id],
+        ).fetchone()
+
+        if row is None:
+            return {"success": False, "message": "No se encontró el trabajo."}
+
+        return {"success": True, "message": "Trabajo encontrado.", "job": format.job_data(row)}
+
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def requeue_stale_jobs(lease_seconds, retention_seconds):
+    """
+    Prepare unfinished jobs to be resumed after a restart.
+
+    Jobs left running for longer than lease_seconds belonged to a worker that
+    stopped, so they are queued again. Finished jobs older than
+    retention_seconds are deleted.
+
+    Returns:
+        list: IDs of the queued jobs, oldest first
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            """
+            UPDATE jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+            """,
+            [f"-{int(lease_seconds)} seconds"],
+        )
+        cursor.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < datetime('now', ?)",
+            [f"-{int(retention_seconds)} seconds"],
+        )
+        conn.commit()
+
+        rows = cursor.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
         ).fetchall()
 
-        if generations is None:
-            return {"success": False, "message": "No se encontraron generaciones."}
+        return [row[0] for row in rows]
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def get_cached_response(key, created_after):
+    """
+    Read a cached model response newer than created_after (a Unix time).
+
+    Returns:
+        str: the response text, or None on a miss
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        row = cursor.execute(
+            "SELECT value, codec FROM response_cache WHERE key = ? AND created_at > ?",
+            [key, created_after],
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        cursor.execute("UPDATE response_cache SET used_at = ? WHERE key = ?", [time.time(), key])
+        conn.commit()
+
+        return compression.decompress(row[0], row[1])
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def set_cached_response(key, text):
+    """Store a model response, compressed like generation bodies."""
+    value, codec = compression.compress(text)
+    now = time.time()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            """
+            INSERT INTO response_cache (key, value, codec, size, created_at, used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value, codec = excluded.codec, size = excluded.size,
+                created_at = excluded.created_at, used_at = excluded.used_at
+            """,
+            [key, value, codec, len(value), now, now],
+        )
+        conn.commit()
+
+    finally:
+        cursor.close()
+        release_connection(conn)
+
+
+def evict_cached_responses(created_before, max_bytes, batch_size=100):
+    """
+    Delete expired cached responses, then the least recently used ones
+    until the stored size is at most max_bytes.
+
+    Returns:
+        int: the number of responses deleted
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("DELETE FROM response_cache WHERE created_at <= ?", [created_before])
+        deleted = cursor.rowcount
+
+        while cursor.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0] > max_bytes:
+            cursor.execute(
+                """
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache ORDER BY used_at LIMIT ?
+                )
+                """,
+                [batch_size],
+            )
+            deleted += cursor.rowcount
+
+        conn.commit()
+        return deleted
+
+    finally:
+        cursor.close()
+        release_connection(conn)
 
-        return {
-            "success": True,
-            "message": "Generaciones encontradas.",
-            "data": format.generation_data(generations),
-        }
+
+def add_usage(rows):
+    """
+    Add counts to the usage ledger in a single transaction.
+
+    Counts of users deleted in the meantime are dropped.
+
+    Args:
+        rows (list): (user_id, type, day, requests, prompt_tokens, response_tokens) tuples
+
+    Returns:
+        dict: success status and message
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO usage (user_id, type, day, requests, prompt_tokens, response_tokens)
+            SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE id = ?1)
+            ON CONFLICT (user_id, day, type) DO UPDATE SET
+                requests = requests + excluded.requests,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                response_tokens = response_tokens + excluded.response_tokens
+            """,
+            rows,
+        )
+
+        conn.commit()
+        return {"success": True, "message": "Consumo guardado."}
 
     except sqlite3.Error as e:
         return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
 
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
+
+
+def get_usage(user_id, since):
+    """
+    Get a user's usage ledger from a day on (ISO date), newest first.
+
+    Returns:
+        dict: success status, message and (day, type, requests, prompt_tokens, response_tokens) rows
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        rows = cursor.execute(
+            """
+            SELECT day, type, requests, prompt_tokens, response_tokens FROM usage
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day DESC, type
+            """,
+            [user_id, since],
+        ).fetchall()
+
+        return {"success": True, "message": "Consumo encontrado.", "rows": rows}
+
+    except sqlite3.Error as e:
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    finally:
+        cursor.close()
+        release_connection(conn)
@@ -1,4 +1,7 @@
-import ast
+import base64
+import html
+import json
+from . import compression
 
 
 def user_data(data):
@@ -9,11 +12,131 @@ def user_data(data):
         "content_type": data[2],
         "target_audience": data[3],
         "additional_context": data[4],
-        "generations": ast.literal_eval(data[5]),
-        "favorite_generations": ast.literal_eval(data[6])
+        "generations": json.loads(data[5]),
+        "favorite_generations": json.loads(data[6]),
+        "profile_version": data[7],
+        "credential_version": data[8],
     }
 
 
 def generation_data(data):
-    """Format generation data for display."""
-    return [{"id": row[0], "type": row[1], "content": row[2]} for row in data]
+    """Format generation data for display, decompressing the stored content."""
+    return [
+        {"id": row[0], "type": row[1], "content": compression.decompress(row[2], row[3])}
+        for row in data
+    ]
+
+
+def job_data(row):
+    """Format an asynchronous generation job for display."""
+    job = {
+        "id": row[0],
+        "type": row[1],
+        "status": row[2],
+        "created_at": row[4],
+        "updated_at": row[5],
+    }
+    if row[3] is not None:
+        job["result"] = json.loads(row[3])
+    return job
+
+
+def usage_data(rows):
+    """Format usage ledger rows (day, type, requests, prompt_tokens, response_tokens)."""
+    return [
+        {
+            "day": row[0],
+            "type": row[1],
+            "requests": row[2],
+            "prompt_tokens": row[3],
+            "response_tokens": row[4],
+        }
+        for row in rows
+    ]
+
+
+def generation_summary_data(data):
+    """Format generation summaries (no content) for listings."""
+    return [
+        {
+            "id": row[0],
+            "type": row[1],
+            "created_at": row[2],
+            "preview": row[3],
+            "size": row[4],
+        }
+        for row in data
+    ]
+
+
+# Delimiters of the matched terms in the snippets SQLite builds. Control
+# characters, so generation text cannot forge them as it could "<mark>".
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+
+def highlight(snippet):
+    """HTML-escape a search snippet and wrap its matched terms in <mark> tags."""
+    return html.escape(snippet).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+
+def search_result_data(data):
+    """Format full-text search results for display."""
+    return [
+        {
+            "id": row[0],
+            "type": row[1],
+            "created_at": row[2],
+            "snippet": highlight(row[3]),
+            "score": -row[4],
+        }
+        for row in data
+    ]
+
+
+PREVIEW_LENGTH = 120
+
+
+def generation_preview(generation_type, content):
+    """Build the short one-line preview shown in generation listings."""
+    text = content
+
+    # Structured generations are stored as JSON; preview their headline field
+    if generation_type in ("newsletter", "thread"):
+        try:
+            parsed = json.loads(content)
+        except ValueError:
+            parsed = None
+
+        if isinstance(parsed, dict):
+            text = parsed.get("title") or parsed.get("subject") or content
+        elif isinstance(parsed, list) and parsed:
+            text = str(parsed[0])
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    preview = lines[0] if lines else ""
+
+    if len(preview) > PREVIEW_LENGTH:
+        preview = preview[: PREVIEW_LENGTH - 1].rstrip() + "…"
+
+    return preview
+
+
+def encode_cursor(last_id):
+    """Encode the last generation ID of a page as an opaque pagination cursor."""
+    payload = json.dumps({"after": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor. Returns None if the cursor is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["after"]
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        return None
+
+    if not isinstance(after, int) or isinstance(after, bool):
+        return None
+
+    return after
@@ -0,0 +1,281 @@
+"""
+Admission control for model calls.
+
+Every call to the model goes through call() or stream(), which:
+
+- wait for a slot of its generation type and then a slot of the process
+  (bulkheads), so a slow type cannot take every worker thread, and give up
+  after ACQUIRE_TIMEOUT. Slots are handed out fairly across users and
+  priority classes (see scheduler.py);
+- retry throttling (429), server errors and network errors with jittered
+  exponential backoff, within the call's deadline;
+- fail fast while the circuit breaker is open, after BREAKER_FAILURES
+  consecutive calls failed upstream (retries included), for
+  BREAKER_COOLDOWN seconds.
+
+Calls that cannot be served raise Unavailable, which views answer with a
+503 and a Retry-After header.
+"""
+import httpx
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from google.genai import errors
+from . import log, scheduler
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+# Per generation type; GEMINI_CONCURRENCY_<TYPE> overrides it for one type
+TYPE_CONCURRENCY = int(os.getenv("GEMINI_TYPE_CONCURRENCY", 8))
+ACQUIRE_TIMEOUT = int(os.getenv("GEMINI_ACQUIRE_TIMEOUT_MS", 5000)) / 1000
+# Total time a call may take, retries included
+DEADLINE = int(os.getenv("GEMINI_DEADLINE_MS", os.getenv("GEMINI_TIMEOUT_MS", 60000))) / 1000
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+RETRY_BASE = int(os.getenv("GEMINI_RETRY_BASE_MS", 500)) / 1000
+RETRY_MAX = int(os.getenv("GEMINI_RETRY_MAX_MS", 8000)) / 1000
+BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = int(os.getenv("GEMINI_BREAKER_COOLDOWN", 30))
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class Unavailable(Exception):
+    """The model cannot take the call now; retry after retry_after seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures and rejects calls for
+    `cooldown` seconds. Then it lets one trial call through (half open):
+    its success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, failures, cooldown, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until the breaker lets calls through again (0 when it does)."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(self._opened_at + self.cooldown - self.clock(), 0)
+
+    def admit(self):
+        """Return 0 if a call may go ahead, or the seconds to wait before trying again."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+
+            remaining = self._opened_at + self.cooldown - self.clock()
+            if remaining > 0:
+                return remaining
+            if self._trial:
+                # Another call is already testing the upstream
+                return 1
+
+            self._trial = True
+            return 0
+
+    def abandon(self):
+        """Give up an admitted call that never reached the upstream."""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial or self._count >= self.failures:
+                self._opened_at = self.clock()
+                self._trial = False
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._opened_at + self.cooldown <= self.clock() else "open"
+
+
+_global = scheduler.FairQueue(MAX_CONCURRENCY)
+_types = {}
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+_lock = threading.Lock()
+_retries = 0
+_rejected = 0
+
+
+def _bulkhead(generation_type):
+    with _lock:
+        if generation_type not in _types:
+            limit = int(os.getenv(f"GEMINI_CONCURRENCY_{generation_type.upper()}", TYPE_CONCURRENCY))
+            _types[generation_type] = scheduler.FairQueue(limit)
+        return _types[generation_type]
+
+
+def _reject(message, retry_after):
+    global _rejected
+
+    with _lock:
+        _rejected += 1
+    log.append(f"{datetime.now()} Llamada al modelo rechazada: {message}")
+    return Unavailable(message, retry_after)
+
+
+def _retryable(e):
+    if isinstance(e, errors.APIError):
+        return e.code in RETRYABLE_CODES
+    return isinstance(e, httpx.TransportError)
+
+
+def _backoff(retry, e):
+    """Full-jitter exponential backoff, never shorter than the upstream's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** retry))
+
+    response = getattr(e, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    return delay
+
+
+def _acquire(generation_type, user, priority, deadline):
+    """Take the breaker's permission and the type and global slots; return the slots taken."""
+    wait = _breaker.admit()
+    if wait:
+        raise _reject("El modelo no está disponible en este momento.", wait)
+
+    acquired = []
+    for bulkhead in (_bulkhead(generation_type), _global):
+        if not bulkhead.acquire(user, priority, min(ACQUIRE_TIMEOUT, deadline - time.monotonic())):
+            for held in acquired:
+                held.release()
+            _breaker.abandon()
+            raise _reject("Demasiadas solicitudes al modelo en curso.", 1)
+        acquired.append(bulkhead)
+
+    return acquired
+
+
+def _attempts(attempt, deadline):
+    """Run attempt(timeout_ms) until it succeeds, fails for good or runs out of time."""
+    global _retries
+
+    for retry in itertools.count():
+        timeout_ms = max(int((deadline - time.monotonic()) * 1000), 1)
+
+        try:
+            result = attempt(timeout_ms)
+        except Exception as e:
+            if not _retryable(e):
+                # The upstream answered; the request itself was wrong, which
+                # tells nothing about the upstream's health
+                _breaker.abandon()
+                raise
+
+            delay = _backoff(retry, e)
+
+            if retry >= MAX_RETRIES or _breaker.retry_after() or time.monotonic() + delay >= deadline:
+                # One failure per call given up on, however many attempts it took
+                _breaker.failure()
+                retry_after = max(_breaker.retry_after(), delay, 1)
+                raise _reject(f"El modelo no está disponible en este momento: {str(e)}", retry_after) from e
+
+            with _lock:
+                _retries += 1
+            time.sleep(delay)
+            continue
+
+        _breaker.success()
+        return result
+
+
+def call(generation_type, attempt, user=None, priority="interactive"):
+    """
+    Make a model call under admission control.
+
+    Args:
+        generation_type: bulkhead the call counts against
+        attempt: function that makes one upstream request, given its timeout
+            in milliseconds, and returns its response
+        user: ID of the user the call is made for, to share slots fairly
+        priority: "interactive" or "batch"
+
+    Raises:
+        Unavailable: when the breaker is open, no slot frees up in time or
+            the upstream keeps failing
+    """
+    deadline = time.monotonic() + DEADLINE
+    acquired = _acquire(generation_type, user, priority, deadline)
+
+    try:
+        return _attempts(attempt, deadline)
+    finally:
+        for bulkhead in acquired:
+            bulkhead.release()
+
+
+def stream(generation_type, attempt, user=None, priority="interactive"):
+    """
+    Like call(), for an attempt that returns an iterator of chunks.
+
+    Opening the stream is retried until the first chunk arrives; errors
+    after that are not. The slots are held until the stream is exhausted
+    or closed.
+    """
+    deadline = time.monotonic() + DEADLINE
+    acquired = _acquire(generation_type, user, priority, deadline)
+
+    def start(timeout_ms):
+        chunks = attempt(timeout_ms)
+        return chunks, next(chunks, None)
+
+    try:
+        chunks, first = _attempts(start, deadline)
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        finally:
+            chunks.close()
+    finally:
+        for bulkhead in acquired:
+            bulkhead.release()
+
+
+def retry_after():
+    """Seconds the circuit breaker stays open (0 when closed)."""
+    return _breaker.retry_after()
+
+
+def stats():
+    """Slots in use and queue depth, globally and per generation type, and breaker state."""
+    with _lock:
+        types = dict(_types)
+        retries, rejected = _retries, _rejected
+
+    return {
+        **_global.stats(),
+        "types": {name: bulkhead.stats() for name, bulkhead in types.items()},
+        "breaker": _breaker.state(),
+        "retries": retries,
+        "rejected": rejected,
+    }
@@ -0,0 +1,107 @@
+"""
+Asynchronous generation jobs.
+
+A job is stored in the jobs table as "queued" and then run by a bounded
+pool of threads, so the request that created it can return right away.
+The worker that runs a job claims it first (queued -> running), so a job
+runs once even when several workers resume it. A job is finished in the
+same transaction that stores its generation.
+
+Handlers are registered by job type with register(). They take the
+user's profile and the request data and return the response message and
+the text to store as a generation (or None to store nothing).
+"""
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from . import db, log
+
+WORKERS = int(os.getenv("JOB_WORKERS", 8))
+# Jobs accepted but not finished by this process; beyond that submit() fails
+MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 256))
+# Running jobs not updated for this long belonged to a stopped worker
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+# Finished jobs are kept this long so clients can fetch their result
+RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 24 * 60 * 60))
+
+# Profile fields a job keeps, so it can run without the request
+PROFILE_FIELDS = ("id", "username", "content_type", "target_audience", "additional_context")
+
+_handlers = {}
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_executor = ThreadPoolExecutor(WORKERS, thread_name_prefix="generation-job")
+
+
+class Busy(Exception):
+    """Too many jobs are already pending in this process."""
+
+
+def register(job_type, handler):
+    _handlers[job_type] = handler
+
+
+def submit(user, job_type, data):
+    """
+    Store a job and schedule it on the pool.
+
+    Returns:
+        str: the job ID
+
+    Raises:
+        Busy: when MAX_PENDING jobs are already pending
+        RuntimeError: when the job cannot be stored
+    """
+    if not _slots.acquire(blocking=False):
+        raise Busy("Demasiados trabajos en curso.")
+
+    job_id = secrets.token_urlsafe(16)
+    payload = {"user": {field: user.get(field) for field in PROFILE_FIELDS}, "data": data}
+
+    result = db.create_job(job_id, user["id"], job_type, payload)
+    if not result["success"]:
+        _slots.release()
+        raise RuntimeError(result["message"])
+
+    _executor.submit(_run, job_id)
+    return job_id
+
+
+def resume():
+    """Queue again the jobs a stopped worker left unfinished and run them here."""
+    for job_id in db.requeue_stale_jobs(LEASE_SECONDS, RETENTION_SECONDS):
+        # Waits for room instead of failing: nobody is waiting on the response
+        _slots.acquire()
+        _executor.submit(_run, job_id)
+
+
+def _run(job_id):
+    try:
+        job = db.claim_job(job_id)
+        if job is None:
+            # Already claimed by another worker
+            return
+
+        user = job["payload"]["user"]
+        handler = _handlers.get(job["type"])
+
+        try:
+            if handler is None:
+                raise ValueError(f"Tipo de trabajo desconocido: {job['type']}")
+            message, text = handler(user, job["payload"]["data"])
+        except Exception as e:
+            log.append(f"{datetime.now()} Falló el trabajo {job_id} del usuario {user['username']}: {str(e)}")
+            db.finish_job(job_id, "error", {"success": False, "message": f"Ocurrió un error: {str(e)}"})
+            return
+
+        generation = (user["id"], job["type"], text) if text is not None else None
+        db.finish_job(job_id, "done", {"success": True, "message": message}, generation)
+
+        log.append(f"{datetime.now()} Trabajo {job_id} del usuario {user['username']} completado.")
+
+    except Exception as e:
+        log.append(f"{datetime.now()} No se pudo ejecutar el trabajo {job_id}: {str(e)}")
+
+    finally:
+        _slots.release()
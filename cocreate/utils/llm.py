@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+import httpx
+from datetime import datetime
+from google import genai
+from google.genai import types
+from . import log
+
+MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# HTTP settings of the shared client. Connections to the model endpoint are
+# kept alive between requests so generations skip the TLS handshake.
+MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", 32))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", 16))
+KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", 120))
+TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", 60000))
+
+_client = None
+_lock = threading.Lock()
+
+
+def _create_client():
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+    return genai.Client(
+        api_key=os.getenv("GOOGLE_AI_STUDIO_API_KEY"),
+        http_options=types.HttpOptions(
+            timeout=TIMEOUT_MS,
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        ),
+    )
+
+
+def get_client():
+    """Return the Gemini client of this process, creating it on first use."""
+    global _client
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _create_client()
+
+    return _client
+
+
+def with_timeout(config, timeout_ms):
+    """Return a copy of a generation config (or a new one) whose request times out after timeout_ms."""
+    http_options = types.HttpOptions(timeout=timeout_ms)
+
+    if config is None:
+        return types.GenerateContentConfig(http_options=http_options)
+    return config.model_copy(update={"http_options": http_options})
+
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's sockets
+    global _client, _lock
+
+    _client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def health():
+    """
+    Check that the model endpoint is reachable with a cheap metadata request.
+
+    Returns:
+        dict: success status, message and the request latency in milliseconds
+    """
+    start = time.monotonic()
+
+    try:
+        get_client().models.get(model=MODEL)
+    except Exception as e:
+        return {"success": False, "message": f"No se pudo contactar con el modelo: {str(e)}"}
+
+    return {
+        "success": True,
+        "message": "Modelo disponible.",
+        "latency_ms": round((time.monotonic() - start) * 1000),
+    }
+
+
+def warmup():
+    """Create the client and open a connection before the first generation needs it."""
+    if not os.getenv("GOOGLE_AI_STUDIO_API_KEY"):
+        return
+
+    result = health()
+    if result["success"]:
+        log.append(f"{datetime.now()} Conexión con el modelo establecida en {result['latency_ms']} ms.")
+    else:
+        log.append(f"{datetime.now()} {result['message']}")
@@ -0,0 +1,441 @@
+"""
+Versioned schema migrations for the CoCreate database.
+
+The schema version is stored in PRAGMA user_version. Each migration runs in
+its own BEGIN IMMEDIATE transaction and re-reads the version once it holds
+the write lock, so several workers can start at the same time and each
+migration is applied exactly once.
+
+Data that would be slow to rewrite in one transaction is filled in by
+backfills. They run after the schema migrations, in small batches, each
+batch in its own short transaction, so the application keeps serving
+requests while they progress.
+"""
+from . import compression, format
+
+
+def _columns(cursor, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+
+
+def _add_column(cursor, table, column, definition):
+    # Databases created by older versions of create_database may already have it
+    if column not in _columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_tables(cursor):
+    """The original users and generations tables."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            content_type TEXT,
+            target_audience TEXT,
+            additional_context TEXT,
+            generations TEXT,
+            favorite_generations TEXT
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            chat TEXT NOT NULL
+        )
+    """
+    )
+
+
+def _link_generations_to_users(cursor):
+    """
+    Replace the JSON ID lists in users.generations and
+    users.favorite_generations with generations.user_id and a favorites table.
+    """
+    _add_column(cursor, "generations", "user_id", "INTEGER REFERENCES users(id) ON DELETE CASCADE")
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS favorites (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            generation_id INTEGER NOT NULL REFERENCES generations(id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id, generation_id)
+        ) WITHOUT ROWID
+    """
+    )
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_favorites_generation_id ON favorites (generation_id)"
+    )
+
+    if "generations" not in _columns(cursor, "users"):
+        return
+
+    cursor.execute(
+        """
+        UPDATE generations
+        SET user_id = owners.user_id
+        FROM (
+            SELECT users.id AS user_id, json_each.value AS generation_id
+            FROM users, json_each(users.generations)
+        ) AS owners
+        WHERE generations.id = owners.generation_id AND generations.user_id IS NULL
+        """
+    )
+
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO favorites (user_id, generation_id)
+        SELECT users.id, json_each.value FROM users, json_each(users.favorite_generations)
+        WHERE json_each.value IN (SELECT id FROM generations)
+        """
+    )
+
+    cursor.execute("ALTER TABLE users DROP COLUMN generations")
+    cursor.execute("ALTER TABLE users DROP COLUMN favorite_generations")
+
+
+def _add_generation_summaries(cursor):
+    """Creation date, preview and size of each generation, for listings."""
+    _add_column(cursor, "generations", "created_at", "TEXT")
+    _add_column(cursor, "generations", "preview", "TEXT")
+    _add_column(cursor, "generations", "size", "INTEGER")
+
+    # Covering index for listings, so summaries never read the chat pages
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_generations_listing
+        ON generations (user_id, id, type, created_at, preview, size)
+    """
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_generations_user_id")
+
+
+def _add_generation_codec(cursor):
+    """Per-row codec marker for compressed generation bodies."""
+    _add_column(cursor, "generations", "codec", "TEXT NOT NULL DEFAULT 'raw'")
+
+
+def _add_full_text_search(cursor):
+    """
+    Full-text index over generation content, kept in sync by triggers.
+    Bodies may be compressed, so the triggers index the decompressed text
+    through the decompress_chat function registered on every connection.
+    """
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts
+        USING fts5(chat, tokenize = 'unicode61 remove_diacritics 2')
+    """
+    )
+
+    cursor.execute("DROP TRIGGER IF EXISTS generations_fts_insert")
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_insert AFTER INSERT ON generations BEGIN
+            INSERT INTO generations_fts (rowid, chat) VALUES (new.id, decompress_chat(new.chat, new.codec));
+        END
+    """
+    )
+
+    cursor.execute("DROP TRIGGER IF EXISTS generations_fts_delete")
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_delete AFTER DELETE ON generations BEGIN
+            DELETE FROM generations_fts WHERE rowid = old.id;
+        END
+    """
+    )
+
+    # Recompressing a body does not change its text, so it is not reindexed
+    cursor.execute("DROP TRIGGER IF EXISTS generations_fts_update")
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_update AFTER UPDATE OF chat ON generations
+        WHEN decompress_chat(old.chat, old.codec) IS NOT decompress_chat(new.chat, new.codec)
+        BEGIN
+            DELETE FROM generations_fts WHERE rowid = old.id;
+            INSERT INTO generations_fts (rowid, chat) VALUES (new.id, decompress_chat(new.chat, new.codec));
+        END
+    """
+    )
+
+
+def _add_profile_version(cursor):
+    """Counter bumped on every profile or password change, carried in access tokens."""
+    _add_column(cursor, "users", "profile_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_jobs(cursor):
+    """Asynchronous generation jobs, so queued work survives a worker restart."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            result TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs (user_id)")
+
+
+def _add_response_cache(cursor):
+    """Model responses keyed by a hash of the request, shared by every worker."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            used_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_used_at ON response_cache (used_at)")
+
+
+def _add_usage(cursor):
+    """Usage ledger: requests and model tokens per user, generation type and day."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS usage (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            response_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, type)
+        ) WITHOUT ROWID
+    """
+    )
+
+
+def _add_credential_version(cursor):
+    """Version of the user's credentials, bumped on password changes to revoke refresh tokens."""
+    _add_column(cursor, "users", "credential_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _external_content_full_text_search(cursor):
+    """
+    Rebuild the full-text index as an external-content table.
+
+    The index used to keep its own uncompressed copy of every body, larger
+    than the compressed bodies themselves. Now it only stores the index;
+    snippets read the text back through the generations_text view, which
+    decompresses the body of each matching row. The index is refilled by
+    the full-text backfill.
+    """
+    for trigger in ("generations_fts_insert", "generations_fts_delete", "generations_fts_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS generations_fts")
+
+    cursor.execute(
+        """
+        CREATE VIEW IF NOT EXISTS generations_text AS
+        SELECT id, decompress_chat(chat, codec) AS chat FROM generations
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE generations_fts USING fts5(
+            chat,
+            content = 'generations_text',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_insert AFTER INSERT ON generations BEGIN
+            INSERT INTO generations_fts (rowid, chat) VALUES (new.id, decompress_chat(new.chat, new.codec));
+        END
+    """
+    )
+
+    # An external-content index is told the old text to remove. Rows the
+    # backfill has not indexed yet have nothing to remove.
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_delete AFTER DELETE ON generations
+        WHEN EXISTS (SELECT 1 FROM generations_fts_docsize WHERE id = old.id)
+        BEGIN
+            INSERT INTO generations_fts (generations_fts, rowid, chat)
+            VALUES ('delete', old.id, decompress_chat(old.chat, old.codec));
+        END
+    """
+    )
+
+    # Recompressing a body does not change its text, so it is not reindexed
+    cursor.execute(
+        """
+        CREATE TRIGGER generations_fts_update AFTER UPDATE OF chat ON generations
+        WHEN decompress_chat(old.chat, old.codec) IS NOT decompress_chat(new.chat, new.codec)
+            AND EXISTS (SELECT 1 FROM generations_fts_docsize WHERE id = old.id)
+        BEGIN
+            INSERT INTO generations_fts (generations_fts, rowid, chat)
+            VALUES ('delete', old.id, decompress_chat(old.chat, old.codec));
+            INSERT INTO generations_fts (rowid, chat) VALUES (new.id, decompress_chat(new.chat, new.codec));
+        END
+    """
+    )
+
+
+# Ordered (version, migration) pairs. Never edit or reorder an applied
+# migration; append a new one instead.
+MIGRATIONS = [
+    (1, _create_tables),
+    (2, _link_generations_to_users),
+    (3, _add_generation_summaries),
+    (4, _add_generation_codec),
+    (5, _add_full_text_search),
+    (6, _add_profile_version),
+    (7, _add_jobs),
+    (8, _add_response_cache),
+    (9, _add_usage),
+    (10, _add_credential_version),
+    (11, _external_content_full_text_search),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply every pending migration.
+
+    Returns:
+        list: the versions applied by this call
+    """
+    applied = []
+
+    for version, migration in MIGRATIONS:
+        if current_version(conn) >= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have applied it while we waited for the lock
+            if current_version(conn) < version:
+                cursor = conn.cursor()
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.close()
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
+
+
+def _backfill_summaries(cursor, after_id, batch_size):
+    """Compute the preview and size of generations stored before they were tracked."""
+    rows = cursor.execute(
+        """
+        SELECT id, type, chat, codec FROM generations
+        WHERE id > ? AND (preview IS NULL OR size IS NULL)
+        ORDER BY id LIMIT ?
+        """,
+        [after_id, batch_size],
+    ).fetchall()
+
+    updates = []
+    for gen_id, gen_type, chat, codec in rows:
+        text = compression.decompress(chat, codec)
+        updates.append((format.generation_preview(gen_type, text), len(text.encode("utf-8")), gen_id))
+
+    cursor.executemany(
+        "UPDATE generations SET preview = ?, size = ? WHERE id = ?", updates
+    )
+
+    return rows[-1][0] if rows else None
+
+
+def _backfill_full_text_index(cursor, after_id, batch_size):
+    """Index generations stored before the full-text table existed (or was rebuilt)."""
+    # The index reads its content from generations itself, so indexed rows
+    # are told apart by their entry in the index's docsize table
+    rows = cursor.execute(
+        """
+        SELECT id, chat, codec FROM generations
+        WHERE id > ? AND NOT EXISTS (SELECT 1 FROM generations_fts_docsize WHERE id = generations.id)
+        ORDER BY id LIMIT ?
+        """,
+        [after_id, batch_size],
+    ).fetchall()
+
+    cursor.executemany(
+        "INSERT INTO generations_fts (rowid, chat) VALUES (?, ?)",
+        [(gen_id, compression.decompress(chat, codec)) for gen_id, chat, codec in rows],
+    )
+
+    return rows[-1][0] if rows else None
+
+
+def _backfill_compression(cursor, after_id, batch_size):
+    """Compress generation bodies stored as plain text."""
+    rows = cursor.execute(
+        "SELECT id, chat FROM generations WHERE codec = 'raw' AND id > ? ORDER BY id LIMIT ?",
+        [after_id, batch_size],
+    ).fetchall()
+
+    updates = []
+    for gen_id, chat in rows:
+        value, codec = compression.compress(chat)
+        if codec != "raw":
+            updates.append((value, codec, gen_id))
+
+    cursor.executemany(
+        "UPDATE generations SET chat = ?, codec = ? WHERE id = ? AND codec = 'raw'", updates
+    )
+
+    return rows[-1][0] if rows else None
+
+
+# Online backfills, run in this order after the schema is up to date. Each
+# one processes the rows after a given ID and returns the last ID it
+# processed, or None when there is nothing left. They must be idempotent.
+BACKFILLS = [
+    _backfill_summaries,
+    _backfill_full_text_index,
+    _backfill_compression,
+]
+
+
+def backfill_batch(conn, backfill, after_id, batch_size):
+    """Run one batch of a backfill in its own write transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        last_id = backfill(cursor, after_id, batch_size)
+        cursor.close()
+        conn.commit()
+        return last_id
+    except Exception:
+        conn.rollback()
+        raise
@@ -1,11 +1,93 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import bcrypt
 
+# bcrypt work factor for new hashes. Hashes with another cost are rehashed
+# on the next successful login.
+ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+# bcrypt keeps a CPU busy for the whole hash, so it runs in a pool of worker
+# processes instead of on the request threads. With PASSWORD_WORKERS=0 it
+# runs inline. When MAX_PENDING operations are already queued or running,
+# new ones fail fast with Busy instead of piling up behind them.
+WORKERS = int(os.getenv("PASSWORD_WORKERS", os.cpu_count() or 1))
+MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", max(WORKERS, 1) * 8))
+
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_lock = threading.Lock()
+_pool = None
+
+
+class Busy(Exception):
+    """Too many password operations are waiting for a worker."""
+
+
+def _hashpw(password_bytes, rounds):
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password_bytes, hashed_password):
+    return bcrypt.checkpw(password_bytes, hashed_password)
+
+
+def _get_pool():
+    global _pool
+
+    with _lock:
+        if _pool is None:
+            # Workers are spawned rather than forked, so they never inherit
+            # locks held by the writer or other request threads
+            _pool = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _run(function, *args):
+    if WORKERS <= 0:
+        return function(*args)
+
+    if not _slots.acquire(blocking=False):
+        raise Busy("Demasiadas operaciones de contraseña en curso.")
+
+    try:
+        try:
+            return _get_pool().submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OS); start a new pool and retry once
+            shutdown()
+            return _get_pool().submit(function, *args).result()
+    finally:
+        _slots.release()
+
+
+def shutdown():
+    """Stop the worker processes. The pool is started again on the next operation."""
+    global _pool
+
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
 def hash(password = ""):
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password_bytes, salt)
-    return hashed_password
+    return _run(_hashpw, password_bytes, ROUNDS)
 
 def valid(password = "", hashed_password = ""):
     password_bytes = password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_password)
+    return _run(_checkpw, password_bytes, hashed_password)
+
+def needs_rehash(hashed_password = b""):
+    """Whether a stored hash was made with a work factor other than ROUNDS."""
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    # "$2b$<cost>$<salt and hash>"
+    return int(hashed_password.split(b"$")[2]) != ROUNDS
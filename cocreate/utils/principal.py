@@ -0,0 +1,40 @@
+from . import db
+
+
+class Principal(dict):
+    """
+    The authenticated user of a request.
+
+    Starts with the fields carried by the access token. Any other user column
+    is loaded from the database the first time it is read, so requests that
+    only need the ID or the profile never query the users table.
+    """
+
+    def __missing__(self, key):
+        if key not in db.USER_COLUMNS or not self.load(key):
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def load(self, *columns):
+        """
+        Load the given columns that are not known yet, in a single query.
+
+        Returns:
+            bool: False if the user no longer exists
+        """
+        missing = [column for column in columns if column not in self]
+        if not missing:
+            return True
+
+        values = db.get_user_columns(dict.__getitem__(self, "id"), missing)
+        if values is None:
+            return False
+
+        self.update(values)
+        return True
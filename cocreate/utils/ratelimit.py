@@ -0,0 +1,201 @@
+"""
+Token bucket rate limiting for the authentication endpoints.
+
+Each key (an IP address or a username) has a bucket of `capacity` tokens
+that refills at `rate` tokens per second; every attempt takes one token.
+A bucket that has refilled completely is indistinguishable from a missing
+one, so it is dropped.
+
+The in-memory backend keeps the buckets of one process and expires them
+with a time wheel. The SQLite backend (RATE_LIMIT_BACKEND=sqlite) keeps
+them in a small local database so every worker on the host shares them.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+DATABASE = os.getenv("RATE_LIMIT_DATABASE_PATH", "ratelimit.db")
+
+IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", 20))
+IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", 20))
+USERNAME_BURST = int(os.getenv("RATE_LIMIT_USERNAME_BURST", 5))
+USERNAME_PER_MINUTE = float(os.getenv("RATE_LIMIT_USERNAME_PER_MINUTE", 5))
+
+# One slot per second; buckets that refill later than this are revisited
+# every WHEEL_SLOTS seconds until they are full
+WHEEL_SLOTS = 64
+
+
+class MemoryLimiter:
+    """Token buckets of this process, expired with a time wheel."""
+
+    def __init__(self, capacity, rate, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self.clock = clock
+        # key -> (tokens, updated_at)
+        self._buckets = {}
+        self._wheel = [set() for _ in range(WHEEL_SLOTS)]
+        self._tick = int(clock())
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Take a token from the key's bucket.
+
+        Returns:
+            float: 0 if allowed, otherwise the seconds until a token is available
+        """
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+
+            tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._schedule(key, now + (self.capacity - tokens) / self.rate)
+            return 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _schedule(self, key, full_at):
+        self._wheel[math.ceil(full_at) % WHEEL_SLOTS].add(key)
+
+    def _expire(self, now):
+        # Visit each slot whose second has passed since the last call
+        current = int(now)
+        for tick in range(self._tick + 1, min(current, self._tick + WHEEL_SLOTS) + 1):
+            slot = self._wheel[tick % WHEEL_SLOTS]
+            keys = list(slot)
+            slot.clear()
+
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+
+                tokens, updated_at = bucket
+                full_at = updated_at + (self.capacity - tokens) / self.rate
+                if full_at <= now:
+                    del self._buckets[key]
+                else:
+                    self._schedule(key, full_at)
+
+        self._tick = max(self._tick, current)
+
+
+class SQLiteLimiter:
+    """Token buckets shared by every worker on the host through a local database."""
+
+    # Full buckets are deleted every this many calls
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, name, capacity, rate, database=DATABASE, clock=time.time):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self.database = database
+        self.clock = clock
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Losing the latest buckets on a crash is harmless
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA busy_timeout = 1000")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    full_at REAL NOT NULL,
+                    PRIMARY KEY (name, key)
+                ) WITHOUT ROWID
+            """
+            )
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key):
+        """
+        Take a token from the key's bucket.
+
+        Returns:
+            float: 0 if allowed, otherwise the seconds until a token is available
+        """
+        conn = self._connection()
+        now = self.clock()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT full_at FROM buckets WHERE name = ? AND key = ?",
+                (self.name, key),
+            ).fetchone()
+
+            # The bucket stores when it will be full; the tokens follow from it
+            tokens = self.capacity
+            if row is not None:
+                tokens = min(self.capacity, self.capacity - (row[0] - now) * self.rate)
+
+            if tokens < 1:
+                retry_after = (1 - tokens) / self.rate
+            else:
+                retry_after = 0
+                tokens -= 1
+                conn.execute(
+                    """
+                    INSERT INTO buckets (name, key, full_at) VALUES (?, ?, ?)
+                    ON CONFLICT (name, key) DO UPDATE SET full_at = excluded.full_at
+                    """,
+                    (self.name, key, now + (self.capacity - tokens) / self.rate),
+                )
+
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+
+            conn.execute("COMMIT")
+            return retry_after
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def limiter(name, burst, per_minute):
+    """Create a limiter with the configured backend."""
+    if BACKEND == "sqlite":
+        return SQLiteLimiter(name, burst, per_minute / 60)
+    return MemoryLimiter(burst, per_minute / 60)
+
+
+_by_ip = limiter("ip", IP_BURST, IP_PER_MINUTE)
+_by_username = limiter("username", USERNAME_BURST, USERNAME_PER_MINUTE)
+
+
+def check_auth_attempt(ip, username):
+    """
+    Count a login or registration attempt against its IP and username.
+
+    Returns:
+        int: 0 if allowed, otherwise the seconds to wait (for Retry-After)
+    """
+    retry_after = _by_ip.acquire(ip or "")
+    if not retry_after and username:
+        retry_after = _by_username.acquire(username)
+
+    return math.ceil(retry_after)
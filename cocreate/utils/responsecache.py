@@ -0,0 +1,93 @@
+"""
+Cache of model responses for identical generation requests.
+
+Entries are keyed by a SHA-256 of the generation type, the model, the
+response schema and the fully rendered prompt, which already includes the
+user's profile. Lookups go to an in-process LRU first and then to the
+response_cache table, which every worker shares. Entries expire after TTL
+seconds and the table is kept under MAX_BYTES by evicting the least
+recently used entries.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from . import cache, db, log
+
+ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+TTL = int(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", 512))
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# The table is trimmed once every this many stores
+EVICT_EVERY = int(os.getenv("RESPONSE_CACHE_EVICT_EVERY", 100))
+
+_memory = cache.LRUCache(MEMORY_SIZE, TTL)
+_stores = 0
+_lock = threading.Lock()
+
+
+def schema_key(schema):
+    """Stable description of a response schema; compute it once per schema."""
+    if schema is None:
+        return None
+    if hasattr(schema, "model_json_schema"):
+        return schema.model_json_schema()
+    return repr(schema)
+
+
+def key(generation_type, contents, model, schema_key=None):
+    """Content address of a generation request, given the schema_key() of its response schema."""
+    material = json.dumps(
+        [generation_type, model, schema_key, contents],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def get(cache_key):
+    """Return the cached response text, or None on a miss."""
+    if not ENABLED:
+        return None
+
+    text = _memory.get(cache_key)
+    if text is not None:
+        return text
+
+    try:
+        text = db.get_cached_response(cache_key, time.time() - TTL)
+    except Exception as e:
+        log.append(f"{datetime.now()} No se pudo leer la caché de respuestas: {str(e)}")
+        return None
+
+    if text is not None:
+        _memory.set(cache_key, text)
+    return text
+
+
+def set(cache_key, text):
+    """Store a response in both tiers; failures only cost a future cache miss."""
+    global _stores
+
+    if not ENABLED or not text:
+        return
+
+    _memory.set(cache_key, text)
+
+    try:
+        db.set_cached_response(cache_key, text)
+
+        with _lock:
+            _stores += 1
+            evict = _stores % EVICT_EVERY == 0
+        if evict:
+            db.evict_cached_responses(time.time() - TTL, MAX_BYTES)
+    except Exception as e:
+        log.append(f"{datetime.now()} No se pudo guardar en la caché de respuestas: {str(e)}")
+
+
+def stats():
+    """Hit, miss and eviction counters of the in-memory tier."""
+    return _memory.stats()
@@ -0,0 +1,101 @@
+"""
+Weighted fair queuing of model calls.
+
+A FairQueue hands out a fixed number of slots. While callers have to wait,
+a freed slot goes to the waiter with the smallest virtual finish tag
+rather than to the one that arrived first. Each flow (a user and a
+priority class) gets tags that advance by 1 / weight of its class from
+the queue's virtual time, so:
+
+- a user with many queued calls only gets their share of the slots, and
+  other users' calls do not wait behind them;
+- interactive calls are served WEIGHTS["interactive"] / WEIGHTS["batch"]
+  times as often as batch calls, without starving them.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+
+WEIGHTS = {
+    "interactive": float(os.getenv("SCHEDULER_INTERACTIVE_WEIGHT", 4)),
+    "batch": float(os.getenv("SCHEDULER_BATCH_WEIGHT", 1)),
+}
+
+# Flows whose last tag is behind the virtual time are forgotten beyond this many
+MAX_FLOWS = int(os.getenv("SCHEDULER_MAX_FLOWS", 1024))
+
+
+class FairQueue:
+    def __init__(self, limit, weights=WEIGHTS):
+        self.limit = limit
+        self.weights = weights
+        self.in_flight = 0
+        self._virtual = 0
+        self._finish = {}
+        # Heap of [finish tag, sequence, start tag, granted]
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _tag(self, flow, priority):
+        start = max(self._virtual, self._finish.get(flow, 0))
+        finish = start + 1 / self.weights[priority]
+        self._finish[flow] = finish
+        return start, finish
+
+    def _grant(self, start):
+        self.in_flight += 1
+        self._virtual = max(self._virtual, start)
+
+        if len(self._finish) > MAX_FLOWS:
+            self._finish = {flow: tag for flow, tag in self._finish.items() if tag > self._virtual}
+
+    def acquire(self, user, priority="interactive", timeout=None):
+        """
+        Wait for a slot for a call of `user` in a priority class.
+
+        Returns:
+            bool: whether a slot was taken before the timeout
+        """
+        flow = (user, priority)
+
+        with self._cond:
+            start, finish = self._tag(flow, priority)
+
+            if self.in_flight < self.limit and not self._waiters:
+                self._grant(start)
+                return True
+
+            waiter = [finish, next(self._sequence), start, False]
+            heapq.heappush(self._waiters, waiter)
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not waiter[3]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    # The flow was not served, so it keeps its place
+                    if self._finish.get(flow) == finish:
+                        self._finish[flow] = finish - 1 / self.weights[priority]
+                    return False
+                self._cond.wait(remaining)
+
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+
+            while self._waiters and self.in_flight < self.limit:
+                waiter = heapq.heappop(self._waiters)
+                waiter[3] = True
+                self._grant(waiter[2])
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"limit": self.limit, "in_flight": self.in_flight, "waiting": len(self._waiters)}
@@ -0,0 +1,68 @@
+import os
+import threading
+
+# How long a duplicate request waits for the one already in flight before
+# making its own call
+TIMEOUT = int(os.getenv("SINGLEFLIGHT_TIMEOUT_MS", 30000)) / 1000
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesces concurrent calls with the same key within a process.
+
+    The first caller (the leader) runs the function; callers that arrive
+    while it is running (followers) wait for it and receive the same result
+    or exception. A follower that waits longer than the timeout makes its
+    own independent call.
+    """
+
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, function, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                return function(*args)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,94 @@
+import jwt
+import os
+import time
+from . import cache
+
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", 15 * 60))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", 30 * 24 * 60 * 60))
+# Tokens from before access and refresh tokens only carry the user ID and
+# never expire. They are accepted until this Unix time (never when unset).
+LEGACY_TOKENS_UNTIL = int(os.getenv("LEGACY_TOKENS_UNTIL", 0))
+
+# Profile fields carried in access tokens, enough to serve most requests
+PROFILE_CLAIMS = ("username", "content_type", "target_audience", "additional_context")
+
+# Newest profile version seen by this process for each user. Entries only
+# need to outlive the access tokens they revoke.
+_profile_versions = cache.LRUCache(int(os.getenv("REVOCATION_CACHE_SIZE", 65536)), ACCESS_TOKEN_TTL)
+
+# Version recorded for deleted users, older than no token
+DELETED = float("inf")
+
+
+def _encode(payload):
+    return jwt.encode(payload, os.getenv("JWT_SECRET"), algorithm="HS256")
+
+
+def create_access_token(user):
+    """Create a short-lived token carrying the user's profile and profile version."""
+    now = int(time.time())
+    payload = {
+        "id": user["id"],
+        "type": "access",
+        "ver": user["profile_version"],
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_TTL,
+    }
+    for claim in PROFILE_CLAIMS:
+        payload[claim] = user.get(claim)
+
+    return _encode(payload)
+
+
+def create_refresh_token(user):
+    """
+    Create a long-lived token that can only be exchanged for a new access token.
+
+    It carries the user's credential version, so changing the password
+    revokes every refresh token issued before.
+    """
+    now = int(time.time())
+    return _encode({
+        "id": user["id"],
+        "type": "refresh",
+        "ver": user["credential_version"],
+        "iat": now,
+        "exp": now + REFRESH_TOKEN_TTL,
+    })
+
+
+def decode(token):
+    """Decode and verify a token. Raises jwt.InvalidTokenError subclasses on failure."""
+    return jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=["HS256"])
+
+
+def record_profile_version(user_id, version):
+    """Remember a user's new profile version so older access tokens are rejected."""
+    known = _profile_versions.get(int(user_id))
+    if known is None or version > known:
+        _profile_versions.set(int(user_id), version)
+
+
+def is_revoked(payload):
+    """Whether an access token predates the newest profile version seen for its user."""
+    known = _profile_versions.get(int(payload["id"]))
+    return known is not None and payload["ver"] < known
+
+
+def is_refresh_revoked(payload, user):
+    """Whether a refresh token predates the user's current credentials."""
+    return payload.get("ver") != user["credential_version"]
+
+
+def legacy_tokens_accepted():
+    """Whether ID-only tokens from before token types existed are still accepted."""
+    return time.time() < LEGACY_TOKENS_UNTIL
+
+
+def user_from_claims(payload):
+    """Rebuild the user fields carried by an access token."""
+    user = {"id": payload["id"], "profile_version": payload["ver"]}
+    for claim in PROFILE_CLAIMS:
+        user[claim] = payload.get(claim)
+
+    return user
@@ -0,0 +1,105 @@
+"""
+Usage ledger: requests and model tokens per user, generation type and day.
+
+Counts are aggregated in memory and added to the usage table by a
+background thread every FLUSH_INTERVAL seconds, in one transaction, so
+serving a generation never writes to the database for accounting. Counts
+not flushed yet are lost if the process is killed; a normal exit flushes
+them.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from . import db, log
+
+FLUSH_INTERVAL = int(os.getenv("USAGE_FLUSH_INTERVAL", 60))
+
+# (user_id, type, day) -> [requests, prompt_tokens, response_tokens]
+_pending = {}
+_lock = threading.Lock()
+_thread = None
+
+
+def _add(counts, user_id, generation_type, day, requests, prompt_tokens, response_tokens):
+    totals = counts.setdefault((user_id, generation_type, day), [0, 0, 0])
+    totals[0] += requests
+    totals[1] += prompt_tokens
+    totals[2] += response_tokens
+
+
+def record(user_id, generation_type, requests=0, prompt_tokens=0, response_tokens=0):
+    """Add to the counts of a user and generation type for today (UTC)."""
+    if not user_id:
+        return
+
+    day = datetime.now(timezone.utc).date().isoformat()
+    with _lock:
+        _add(_pending, user_id, generation_type, day, requests, prompt_tokens, response_tokens)
+
+    _ensure_started()
+
+
+def record_response(user_id, generation_type, response):
+    """Add the tokens reported in a model response's usage metadata."""
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return
+
+    record(
+        user_id,
+        generation_type,
+        prompt_tokens=metadata.prompt_token_count or 0,
+        response_tokens=metadata.candidates_token_count or 0,
+    )
+
+
+def pending(user_id):
+    """Counts of a user not flushed yet, as (day, type, requests, prompt_tokens, response_tokens) rows."""
+    with _lock:
+        return [(day, _type, *counts) for (_id, _type, day), counts in _pending.items() if _id == user_id]
+
+
+def flush():
+    """Add the pending counts to the usage table; on failure they are kept for the next flush."""
+    global _pending
+
+    with _lock:
+        counts, _pending = _pending, {}
+
+    if not counts:
+        return
+
+    result = db.add_usage([(*key, *totals) for key, totals in counts.items()])
+    if result["success"]:
+        return
+
+    log.append(f"{datetime.now()} No se pudo guardar el consumo: {result['message']}")
+    with _lock:
+        for (user_id, generation_type, day), totals in counts.items():
+            _add(_pending, user_id, generation_type, day, *totals)
+
+
+def _ensure_started():
+    global _thread
+
+    if _thread is not None:
+        return
+
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="usage-flush", daemon=True)
+            _thread.start()
+
+
+def _run():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            log.append(f"{datetime.now()} No se pudo guardar el consumo: {str(e)}")
+
+
+atexit.register(flush)
@@ -1,6 +1,10 @@
 import jwt
-import os
-from . import db
+from datetime import datetime
+from functools import wraps
+from flask import g, request
+from . import log
+from . import tokens
+from . import principal
 
 
 def is_username_valid(username="") -> dict:
@@ -45,37 +49,57 @@ def is_password_valid(password="") -> dict:
     return {"success": True, "message": "Contraseña válida."}
 
 
-def validate_jwt(token="") -> dict:
+def validate_jwt(token="", columns=()) -> dict:
     """
     Validates a JWT token and returns the user information if valid.
 
+    Access tokens carry the user's profile, so they are validated without
+    touching the database. Tokens issued before access tokens existed only
+    carry the user ID and never expire: they are resolved with a database
+    lookup, only until tokens.LEGACY_TOKENS_UNTIL and only while the user's
+    password has not changed.
+
     Args:
         token (str): The JWT token to validate
+        columns (tuple): User columns the caller needs besides the token claims
 
     Returns:
-        dict: A dictionary with success status and user object if successful
+        dict: A dictionary with success status and a Principal as user if successful
     """
     if not token:
         return {"success": False, "message": "El token no puede estar vacío."}
 
     try:
         # Decode token
-        payload = jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=["HS256"])
+        payload = tokens.decode(token)
         user_id = payload.get("id")
 
-        if not user_id:
+        if not user_id or payload.get("type") == "refresh":
             return {"success": False, "message": "Formato del token inválido."}
 
-        # Verify user exists and get user information
-        user_result = db.get_user_by_id(user_id)
-        if not user_result["success"]:
+        if payload.get("type") == "access":
+            if tokens.is_revoked(payload):
+                return {"success": False, "message": "Token revocado."}
+
+            user = principal.Principal(tokens.user_from_claims(payload))
+        else:
+            if not tokens.legacy_tokens_accepted():
+                return {"success": False, "message": "Token expirado."}
+
+            user = principal.Principal(id=user_id)
+            columns = ("username", "credential_version", *columns)
+
+        # Verify user exists and load the columns the token does not carry
+        if not user.load(*columns):
             return {"success": False, "message": "Token inválido - no se encuentra el usuario."}
 
-        # Return the successful result with user object
+        if payload.get("type") is None and user["credential_version"] > 0:
+            return {"success": False, "message": "Token revocado."}
+
         return {
             "success": True,
             "message": "Token válido.",
-            "user": user_result["user"],
+            "user": user,
         }
 
     except jwt.ExpiredSignatureError:
@@ -86,3 +110,41 @@ def validate_jwt(token="") -> dict:
 
     except Exception as e:
         return {"success": False, "message": f"Error al validar el token: {str(e)}"}
+
+
+def require_auth(action, columns=()):
+    """
+    Authenticate the request before running the view.
+
+    The caller is resolved once from the Authorization header and stored in
+    flask.g.principal. Failures are logged as "No se pudo <action>: ..." and
+    answered with 401; action may reference the view's URL arguments.
+
+    Args:
+        action (str): What the view does, for log lines
+        columns (tuple): User columns the view needs besides the token claims
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            description = action.format(**kwargs)
+
+            # Get token from Authorization header
+            auth_header = request.headers.get("Authorization")
+            if not auth_header or not auth_header.startswith("Bearer "):
+                log.append(f"{datetime.now()} No se pudo {description}: Token de autorización requerido.")
+                return {"success": False, "message": "Token de autorización requerido"}, 401
+
+            # Validate JWT token
+            validation_result = validate_jwt(auth_header.split(" ")[1], columns)
+            if not validation_result["success"]:
+                log.append(f"{datetime.now()} No se pudo {description}: {validation_result['message']}")
+                return {"success": False, "message": validation_result["message"]}, 401
+
+            g.principal = validation_result["user"]
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,153 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from . import db, log
+
+# Durability of generation writes:
+#   "async" - respond as soon as the generation is queued (write-behind)
+#   "group" - queue it, but wait until the batch containing it is committed
+#   "sync"  - write it on the request thread, one transaction per generation
+MODE = os.getenv("GENERATION_WRITE_MODE", "async")
+QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", 1000))
+BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", 100))
+FLUSH_INTERVAL = int(os.getenv("GENERATION_FLUSH_INTERVAL_MS", 50)) / 1000
+ENQUEUE_TIMEOUT = int(os.getenv("GENERATION_ENQUEUE_TIMEOUT_MS", 100)) / 1000
+
+_STOP = object()
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_lock = threading.Lock()
+_thread = None
+
+
+class _Pending:
+    """A generation waiting in the queue, with an optional commit notification."""
+
+    def __init__(self, user_id, generation_type, chat, wait):
+        self.row = (user_id, generation_type, chat)
+        self.done = threading.Event() if wait else None
+        self.result = None
+
+
+def submit(user_id, generation_type, chat):
+    """
+    Persist a generation according to the configured write mode.
+
+    When the queue stays full for longer than the enqueue timeout, the
+    generation is written on the caller's thread instead, so back-pressure
+    slows producers down rather than dropping writes.
+    """
+    if MODE == "sync" or not user_id:
+        return db.create_generation(user_id, generation_type, chat)
+
+    _ensure_started()
+
+    pending = _Pending(user_id, generation_type, chat, wait=MODE == "group")
+    try:
+        _queue.put(pending, timeout=ENQUEUE_TIMEOUT)
+    except queue.Full:
+        log.append(f"{datetime.now()} Cola de escritura llena: la generación se guardó de forma síncrona.")
+        return db.create_generation(user_id, generation_type, chat)
+
+    if pending.done is None:
+        return {"success": True, "message": "Generación encolada."}
+
+    pending.done.wait()
+    return pending.result
+
+
+def flush():
+    """Block until every queued generation has been committed."""
+    if _thread is not None:
+        _queue.join()
+
+
+def stop():
+    """Flush the queue and stop the writer thread."""
+    global _thread
+
+    with _lock:
+        if _thread is None:
+            return
+        _queue.put(_STOP)
+        _thread.join()
+        _thread = None
+
+
+def _ensure_started():
+    global _thread
+
+    if _thread is not None:
+        return
+
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="generation-writer", daemon=True)
+            _thread.start()
+
+
+def _run():
+    while True:
+        item = _queue.get()
+        if item is _STOP:
+            _queue.task_done()
+            return
+
+        # Group commit: gather whatever arrives within the flush interval
+        batch = [item]
+        stopping = False
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+
+        _write(batch)
+
+        for _ in batch:
+            _queue.task_done()
+
+        if stopping:
+            _queue.task_done()
+            return
+
+
+def _write(batch):
+    try:
+        result = db.create_generations([pending.row for pending in batch])
+    except Exception as e:
+        result = {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+    if result["success"]:
+        results = [result] * len(batch)
+    else:
+        # Retry one by one so a single bad row does not lose the whole batch
+        log.append(f"{datetime.now()} No se pudo guardar un lote de {len(batch)} generaciones: {result['message']}")
+        results = [_write_one(pending.row) for pending in batch]
+
+    for pending, pending_result in zip(batch, results):
+        if pending.done is not None:
+            pending.result = pending_result
+            pending.done.set()
+
+
+def _write_one(row):
+    try:
+        return db.create_generation(*row)
+    except Exception as e:
+        log.append(f"{datetime.now()} No se pudo guardar la generación del usuario {row[0]}: {str(e)}")
+        return {"success": False, "message": f"Ocurrió un error: {str(e)}"}
+
+
+atexit.register(stop)
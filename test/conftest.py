@@ -0,0 +1,97 @@
+import queue
+import threading
+import pytest
+from types import SimpleNamespace
+from cocreate import create_app
+from cocreate.utils import cache, db, gateway, jobs, llm, password, ratelimit, responsecache, tokens, usage
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory: log lines go to cocreate.log in the working directory."""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh, migrated database with empty caches and cheap inline password hashing."""
+    monkeypatch.setattr(db, "DATABASE", str(tmp_path / "test.db"))
+    monkeypatch.setattr(db, "_pool", queue.LifoQueue(maxsize=db.POOL_SIZE))
+    monkeypatch.setattr(db, "_unknown_usernames", cache.LRUCache(16, 60))
+    monkeypatch.setattr(password, "WORKERS", 0)
+    monkeypatch.setattr(password, "ROUNDS", 4)
+    db.create_database()
+
+    yield db
+
+    db.close_connections()
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """A test client of the app on the test database, without rate limits on authentication."""
+    monkeypatch.setenv("JWT_SECRET", "test-secret")
+    monkeypatch.setattr(ratelimit, "_by_ip", ratelimit.MemoryLimiter(1000, 1000))
+    monkeypatch.setattr(ratelimit, "_by_username", ratelimit.MemoryLimiter(1000, 1000))
+    monkeypatch.setattr(tokens, "_profile_versions", cache.LRUCache(16, 60))
+    # Startup work that would outlive the test database
+    monkeypatch.setattr(db, "run_backfills", lambda: None)
+    monkeypatch.setattr(jobs, "resume", lambda: None)
+    monkeypatch.setattr(llm, "warmup", lambda: None)
+
+    return create_app().test_client()
+
+
+@pytest.fixture
+def register(client):
+    """Register a user and return the response body, with its access and refresh tokens."""
+
+    def register(username="ana", password="Secreta123"):
+        response = client.post("/auth/register", json={"username": username, "password": password})
+        assert response.status_code == 200
+        return response.json
+
+    return register
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+class FakeModels:
+    """
+    Stands in for client.models: answers every call with reply(contents), or
+    streams the texts of chunks(contents), and records it.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.reply = lambda contents: "respuesta"
+        self.chunks = lambda contents: [self.reply(contents)]
+        self.streams_closed = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        with self._lock:
+            self.calls.append(contents)
+        return SimpleNamespace(text=self.reply(contents), usage_metadata=None)
+
+    def generate_content_stream(self, model, contents, config=None):
+        with self._lock:
+            self.calls.append(contents)
+        try:
+            for text in self.chunks(contents):
+                yield SimpleNamespace(text=text, usage_metadata=None)
+        finally:
+            self.streams_closed += 1
+
+
+@pytest.fixture
+def model(database, monkeypatch):
+    """A fake model client, with an empty response cache, usage ledger and circuit breaker."""
+    models = FakeModels()
+    monkeypatch.setattr(llm, "get_client", lambda: SimpleNamespace(models=models))
+    monkeypatch.setattr(responsecache, "_memory", cache.LRUCache(16, 60))
+    monkeypatch.setattr(usage, "_pending", {})
+    monkeypatch.setattr(gateway, "_breaker", gateway.CircuitBreaker(5, 30))
+    return models
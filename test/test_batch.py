@@ -0,0 +1,95 @@
+import threading
+import time
+from cocreate import generate
+from conftest import bearer
+
+
+def prompt_of(contents):
+    return contents.split("sobre ")[1].split(".")[0]
+
+
+def test_results_keep_request_order_and_failures_stay_per_item(client, register, model, database, monkeypatch):
+    headers = bearer(register()["access_token"])
+    writes = []
+    create_generations = database.create_generations
+
+    def spy(generations):
+        writes.append(generations)
+        return create_generations(generations)
+
+    monkeypatch.setattr(database, "create_generations", spy)
+
+    def reply(contents):
+        if "Reescribe" in contents:
+            return "texto formal"
+        if "fallo" in contents:
+            raise RuntimeError("sin respuesta")
+        if "gatos" in contents:
+            # The first item finishes last
+            time.sleep(0.1)
+        return f"guion de {prompt_of(contents)}"
+
+    model.reply = reply
+    items = [
+        {"type": "video-script", "prompt": "gatos"},
+        {"type": "desconocido", "prompt": "gatos"},
+        {"type": "content_idea", "prompt": "fallo"},
+        {"type": "change_tone", "text": "hola"},
+        {"type": "video_script", "prompt": "perros"},
+        {"type": "video_script", "prompt": ""},
+    ]
+
+    response = client.post("/generate/batch", json={"items": items}, headers=headers)
+
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert [result["index"] for result in results] == list(range(6))
+    assert [result["success"] for result in results] == [True, False, False, True, True, False]
+    assert results[0]["message"] == "guion de gatos"
+    assert results[1]["message"] == "Tipo de generación desconocido"
+    assert results[2]["message"] == "Ocurrió un error: sin respuesta"
+    assert results[3] == {"index": 3, "type": "change_tone", "success": True, "message": "texto formal"}
+    assert results[5]["message"] == "El prompt no puede estar vacío"
+
+    # Persisted types are stored together, in one transaction
+    assert len(writes) == 1
+    assert sorted(chat for _, _, chat in writes[0]) == ["guion de gatos", "guion de perros"]
+
+
+def test_items_run_concurrently_up_to_the_batch_limit(client, register, model, monkeypatch):
+    monkeypatch.setattr(generate, "BATCH_CONCURRENCY", 2)
+    headers = bearer(register()["access_token"])
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def reply(contents):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return prompt_of(contents)
+
+    model.reply = reply
+    items = [{"type": "video_script", "prompt": f"tema {index}"} for index in range(6)]
+
+    response = client.post("/generate/batch", json={"items": items}, headers=headers)
+
+    assert [result["message"] for result in response.json["results"]] == [f"tema {index}" for index in range(6)]
+    assert len(model.calls) == 6
+    assert peak[0] == 2
+
+
+def test_stopping_the_fan_out_cancels_items_not_started(model, monkeypatch):
+    monkeypatch.setattr(generate, "BATCH_CONCURRENCY", 1)
+    user = {"id": 1, "username": "ana", "content_type": None, "target_audience": None, "additional_context": None}
+    kind = generate.generation_types.TYPES["video_script"]
+    items = [(index, kind, {"prompt": f"tema {index}"}) for index in range(3)]
+
+    results = generate._fan_out(user, items)
+    assert next(results)[0] == 0
+    results.close()
+
+    assert len(model.calls) == 1
@@ -0,0 +1,39 @@
+import time
+from cocreate.utils import cache
+
+
+def test_cache_hit_and_miss():
+    lru = cache.LRUCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.stats()["hits"] == 1
+    assert lru.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_cache_expires_and_invalidates():
+    lru = cache.LRUCache(maxsize=2, ttl=0.01)
+    lru.set("a", 1)
+    time.sleep(0.02)
+
+    assert lru.get("a") is None
+
+    lru.ttl = 60
+    lru.set("b", 2)
+    lru.invalidate("b")
+
+    assert lru.get("b") is None
@@ -0,0 +1,19 @@
+from cocreate.utils import compression
+
+
+def test_compress_round_trip():
+    text = "Este es un guion de prueba. " * 50
+    value, codec = compression.compress(text)
+
+    assert codec != "raw"
+    assert isinstance(value, bytes)
+    assert len(value) < len(text.encode("utf-8"))
+    assert compression.decompress(value, codec) == text
+
+
+def test_small_text_is_stored_raw():
+    value, codec = compression.compress("hola")
+
+    assert codec == "raw"
+    assert value == "hola"
+    assert compression.decompress(value, codec) == "hola"
@@ -0,0 +1,169 @@
+import os
+import queue
+import sqlite3
+import pytest
+from cocreate.utils import db, password, usage
+
+
+def test_generate_user_id_fits_javascript_numbers():
+    user_id = db.generate_user_id()
+
+    assert isinstance(user_id, int)
+    assert 0 < user_id < 2**53
+
+
+def test_generate_user_id_is_time_ordered():
+    first = db.generate_user_id()
+    second = db.generate_user_id()
+
+    assert second >> db.USER_ID_RANDOM_BITS >= first >> db.USER_ID_RANDOM_BITS
+
+
+def test_credentials_and_unknown_usernames(database):
+    assert db.get_credentials_by_username("ana")["success"] is False
+    assert db.unknown_username_cache_stats()["size"] == 1
+    assert db.get_credentials_by_username("ana")["success"] is False
+    assert db.unknown_username_cache_stats()["hits"] == 1
+
+    db.create_user("ana", "Secreta123")
+    credentials = db.get_credentials_by_username("ana")
+
+    assert credentials["success"] is True
+    assert credentials["user"]["username"] == "ana"
+    assert password.valid("Secreta123", credentials["password"])
+
+
+def test_jobs_are_claimed_once(database):
+    user_id = db.create_user("ana", "Secreta123")["user_id"]
+
+    db.create_job("job", user_id, "video_script", {"data": {"prompt": "gatos"}})
+    assert db.requeue_stale_jobs(300, 3600) == ["job"]
+
+    assert db.claim_job("job")["payload"] == {"data": {"prompt": "gatos"}}
+    assert db.claim_job("job") is None
+
+    db.finish_job("job", "done", {"success": True, "message": "guion"}, (user_id, "video_script", "guion"))
+    job = db.get_job(user_id, "job")["job"]
+
+    assert job["status"] == "done"
+    assert job["result"]["message"] == "guion"
+    assert db.get_generations_by_user_id(user_id)["data"][0]["content"] == "guion"
+    assert db.get_job(user_id + 1, "job")["success"] is False
+
+
+def test_usage_ledger_adds_up_across_flushes(database, monkeypatch):
+    monkeypatch.setattr(usage, "_pending", {})
+    monkeypatch.setattr(usage, "_thread", object())
+    user_id = db.create_user("ana", "Secreta123")["user_id"]
+
+    for _ in range(2):
+        usage.record(user_id, "thread", requests=1, prompt_tokens=10, response_tokens=20)
+        usage.flush()
+    usage.record(user_id, "thread", requests=1)
+    # Counts of unknown users are dropped instead of failing the flush
+    usage.record(user_id + 1, "thread", requests=1)
+
+    assert usage.pending(user_id)[0][1:] == ("thread", 1, 0, 0)
+    usage.flush()
+
+    rows = db.get_usage(user_id, "0000-00-00")["rows"]
+    assert [row[1:] for row in rows] == [("thread", 3, 20, 40)]
+    assert usage.pending(user_id) == []
+
+
+def test_user_reads_see_every_change(database):
+    user_id = db.create_user("ana", "Secreta123")["user_id"]
+
+    for update, field, value in [
+        (db.update_user_content_type, "content_type", "humor"),
+        (db.update_user_target_audience, "target_audience", "estudiantes"),
+        (db.update_user_additional_context, "additional_context", "breve"),
+    ]:
+        before = db.get_user_by_id(user_id)["user"]
+
+        update(user_id, value)
+        user = db.get_user_by_id(user_id)["user"]
+        assert user[field] == value
+        assert user["profile_version"] == before["profile_version"] + 1
+
+    db.update_user_password_by_id(user_id, "Nueva1234")
+    assert db.get_user_by_id(user_id)["user"]["credential_version"] == 1
+
+    db.create_generation(user_id, "video_script", "guion")
+    assert len(db.get_user_by_id(user_id)["user"]["generations"]) == 1
+
+
+def test_deleted_users_are_not_found(database):
+    user_id = db.create_user("ana", "Secreta123")["user_id"]
+    assert db.get_user_by_id(user_id)["success"] is True
+
+    db.delete_user(user_id)
+
+    assert db.get_user_by_id(user_id)["success"] is False
+
+
+def test_pool_reuses_connections_and_rolls_back_on_release(database):
+    conn = db.get_connection()
+    conn.execute("INSERT INTO users (id, username, password) VALUES (1, 'ana', 'x')")
+    db.release_connection(conn)
+
+    assert db.get_connection() is conn
+    assert conn.execute("SELECT count(*) FROM users").fetchone() == (0,)
+    db.release_connection(conn)
+
+
+def test_pool_closes_connections_beyond_its_size(database, monkeypatch):
+    monkeypatch.setattr(db, "_pool", queue.LifoQueue(maxsize=1))
+    first, second = db.get_connection(), db.get_connection()
+    db.release_connection(first)
+    db.release_connection(second)
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        second.execute("SELECT 1")
+    assert db.get_connection() is first
+
+    db.release_connection(first)
+    db.close_connections()
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_children_open_their_own_connections(database):
+    conn = db.get_connection()
+    db.release_connection(conn)
+
+    pid = os.fork()
+    if pid == 0:
+        # Exit status 0 only if the child got a fresh pool that works
+        ok = False
+        try:
+            fresh = db.get_connection()
+            ok = fresh is not conn and fresh.execute("SELECT count(*) FROM users").fetchone() == (0,)
+        finally:
+            os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert db.get_connection() is conn
+    db.release_connection(conn)
+
+
+def test_listings_paginate_the_same_way(database):
+    user_id = db.create_user("ana", "Secreta123")["user_id"]
+    db.create_generations([(user_id, "video_script", f"guion {index}") for index in range(5)])
+    ids = [generation["id"] for generation in db.get_generations_by_user_id(user_id)["data"]]
+    for gen_id in ids:
+        db.save_generation(user_id, gen_id)
+
+    for listing in (db.get_generations_by_user_id, db.get_saved_generations_by_user_id):
+        first = listing(user_id, limit=2, with_total=True, summary=True)
+        assert [generation["id"] for generation in first["data"]] == ids[:2]
+        assert first["next_after_id"] == ids[1]
+        assert first["total"] == 5
+        assert "content" not in first["data"][0]
+
+        last = listing(user_id, limit=3, after_id=first["next_after_id"])
+        assert [generation["content"] for generation in last["data"]] == ["guion 2", "guion 3", "guion 4"]
+        assert last["next_after_id"] is None
+        assert "total" not in last
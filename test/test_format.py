@@ -1,3 +1,4 @@
+import zlib
 from cocreate.utils import format
 
 
@@ -10,6 +11,8 @@ def test_format_user_data():
         "Additional context",
         "[1, 2, 3]",
         "[4, 5]",
+        3,
+        1,
     )
     formatted_data = format.user_data(user_data)
     assert formatted_data == {
@@ -20,16 +23,53 @@ def test_format_user_data():
         "additional_context": "Additional context",
         "generations": [1, 2, 3],
         "favorite_generations": [4, 5],
+        "profile_version": 3,
+        "credential_version": 1,
     }
 
 
 def test_format_generation_data():
     generation_data = [
-        (1, "newsletter", "This is a test generation."),
-        (2, "thread", "This is another test generation."),
+        (1, "newsletter", "This is a test generation.", "raw"),
+        (2, "thread", zlib.compress(b"This is another test generation."), "zlib"),
     ]
     formatted_data = format.generation_data(generation_data)
     assert formatted_data == [
         {"id": 1, "type": "newsletter", "content": "This is a test generation."},
         {"id": 2, "type": "thread", "content": "This is another test generation."},
     ]
+
+
+def test_cursor_round_trip():
+    cursor = format.encode_cursor(42)
+    assert isinstance(cursor, str)
+    assert format.decode_cursor(cursor) == 42
+
+
+def test_decode_invalid_cursor():
+    assert format.decode_cursor("not-a-cursor") is None
+    assert format.decode_cursor(format.encode_cursor("42")) is None
+
+
+def test_format_generation_summary_data():
+    summary_data = [(1, "thread", "2025-01-01 10:00:00", "First tweet", 42)]
+    formatted_data = format.generation_summary_data(summary_data)
+    assert formatted_data == [
+        {
+            "id": 1,
+            "type": "thread",
+            "created_at": "2025-01-01 10:00:00",
+            "preview": "First tweet",
+            "size": 42,
+        }
+    ]
+
+
+def test_generation_preview():
+    assert format.generation_preview("video_script", "\n(00:00:00) Intro\nMore") == "(00:00:00) Intro"
+    assert format.generation_preview("thread", '["First tweet", "Second"]') == "First tweet"
+    assert format.generation_preview("newsletter", '{"subject": "S", "title": "T"}') == "T"
+
+    preview = format.generation_preview("content_idea", "x" * 500)
+    assert len(preview) == format.PREVIEW_LENGTH
+    assert preview.endswith("…")
@@ -0,0 +1,119 @@
+import pytest
+from google.genai import errors
+from cocreate.utils import gateway
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    clock = Clock()
+    breaker = gateway.CircuitBreaker(failures=2, cooldown=10, clock=clock)
+
+    breaker.failure()
+    assert breaker.admit() == 0
+    breaker.failure()
+    assert breaker.state() == "open"
+    assert breaker.admit() == 10
+
+    clock.now = 10
+    assert breaker.admit() == 0
+    assert breaker.admit() == 1  # only one trial at a time
+
+    breaker.failure()
+    assert breaker.admit() == 10
+
+    clock.now = 20
+    assert breaker.admit() == 0
+    breaker.success()
+    assert breaker.state() == "closed"
+
+
+def test_call_retries_upstream_errors_but_not_bad_requests(monkeypatch):
+    monkeypatch.setattr(gateway, "_breaker", gateway.CircuitBreaker(5, 30))
+    monkeypatch.setattr(gateway, "RETRY_BASE", 0)
+    attempts = []
+
+    def flaky(timeout_ms):
+        attempts.append(timeout_ms)
+        if len(attempts) < 3:
+            raise errors.ServerError(503, {"error": {"message": "sobrecargado"}})
+        return "respuesta"
+
+    assert gateway.call("content_idea", flaky) == "respuesta"
+    assert len(attempts) == 3
+
+    def invalid(timeout_ms):
+        attempts.append(timeout_ms)
+        raise errors.ClientError(400, {"error": {"message": "inválido"}})
+
+    with pytest.raises(errors.ClientError):
+        gateway.call("content_idea", invalid)
+    assert len(attempts) == 4
+
+
+def test_call_fails_fast_while_the_breaker_is_open(monkeypatch):
+    monkeypatch.setattr(gateway, "_breaker", gateway.CircuitBreaker(1, 30))
+    monkeypatch.setattr(gateway, "RETRY_BASE", 0)
+
+    def down(timeout_ms):
+        raise errors.ServerError(503, {"error": {"message": "caído"}})
+
+    with pytest.raises(gateway.Unavailable):
+        gateway.call("thread", down)
+
+    with pytest.raises(gateway.Unavailable) as e:
+        gateway.call("thread", lambda timeout_ms: "no se llama")
+    assert e.value.retry_after > 0
+    assert gateway.stats()["breaker"] == "open"
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_breaker_counts_calls_not_attempts(monkeypatch):
+    breaker = gateway.CircuitBreaker(2, 30)
+    monkeypatch.setattr(gateway, "_breaker", breaker)
+    monkeypatch.setattr(gateway, "RETRY_BASE", 0)
+    monkeypatch.setattr(gateway, "MAX_RETRIES", 3)
+    attempts = []
+
+    def down(timeout_ms):
+        attempts.append(timeout_ms)
+        raise errors.ServerError(503, {"error": {"message": "caído"}})
+
+    with pytest.raises(gateway.Unavailable):
+        gateway.call("thread", down)
+    assert len(attempts) == 4
+    assert breaker.state() == "closed"
+
+    with pytest.raises(gateway.Unavailable) as e:
+        gateway.call("thread", down)
+    assert breaker.state() == "open"
+    assert e.value.retry_after == pytest.approx(30, abs=1)
+
+
+def test_bad_requests_leave_the_breaker_alone(monkeypatch):
+    clock = Clock()
+    breaker = gateway.CircuitBreaker(2, 10, clock=clock)
+    monkeypatch.setattr(gateway, "_breaker", breaker)
+
+    def invalid(timeout_ms):
+        raise errors.ClientError(400, {"error": {"message": "inválido"}})
+
+    breaker.failure()
+    with pytest.raises(errors.ClientError):
+        gateway.call("thread", invalid)
+    breaker.failure()
+    assert breaker.state() == "open"
+
+    # A bad request as the half-open trial neither closes the breaker nor blocks the next trial
+    clock.now = 10
+    with pytest.raises(errors.ClientError):
+        gateway.call("thread", invalid)
+    assert breaker.state() == "half_open"
+    assert gateway.call("thread", lambda timeout_ms: "respuesta") == "respuesta"
+    assert breaker.state() == "closed"
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cocreate import generate
+from cocreate.generation_types import TYPES
+from cocreate.utils import jobs
+from conftest import bearer
+
+USER = {"id": 1, "username": "ana", "content_type": None, "target_audience": None, "additional_context": None}
+
+
+def test_identical_requests_are_answered_from_the_cache(model):
+    kind = TYPES["video_script"]
+
+    assert generate._generate(kind, USER, {"prompt": "gatos"}) == ("respuesta", "respuesta")
+    assert generate._generate(kind, USER, {"prompt": "gatos"}) == ("respuesta", "respuesta")
+    assert len(model.calls) == 1
+
+
+def test_fresh_requests_call_the_model_even_with_an_identical_call_in_flight(model):
+    kind = TYPES["video_script"]
+    generate._generate(kind, USER, {"prompt": "gatos"})
+
+    # Both calls must reach the model at once, or the barrier breaks
+    barrier = threading.Barrier(2, timeout=5)
+
+    def reply(contents):
+        barrier.wait()
+        return "variante"
+
+    model.reply = reply
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: generate._generate(kind, USER, {"prompt": "gatos", "fresh": True}), range(2)))
+
+    assert results == [("variante", "variante")] * 2
+    assert len(model.calls) == 3
+
+
+def test_async_request_answers_json_when_the_job_cannot_be_stored(client, register, database, monkeypatch):
+    headers = bearer(register()["access_token"])
+    monkeypatch.setattr(database, "create_job", lambda *args: {"success": False, "message": "Ocurrió un error: disco lleno"})
+
+    response = client.post("/generate/video-script?async=1", json={"prompt": "gatos"}, headers=headers)
+
+    assert response.status_code == 500
+    assert response.json == {"success": False, "message": "Ocurrió un error: disco lleno"}
+    # The job's slot is given back
+    assert jobs._slots._value == jobs.MAX_PENDING
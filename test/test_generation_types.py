@@ -0,0 +1,23 @@
+from cocreate.generation_types import TYPES
+
+
+def test_read_applies_defaults_and_rejects_empty_fields():
+    change_tone = TYPES["change_tone"]
+
+    assert change_tone.read({"text": "hola"}) == {"text": "hola", "tone": "profesional"}
+    assert change_tone.read({"text": "hola", "tone": "casual"}) == {"text": "hola", "tone": "casual"}
+    assert change_tone.read({"text": ""}) is None
+    assert TYPES["video_script"].read({}) is None
+
+
+def test_contents_include_the_profile_and_messages_follow_the_schema():
+    user = {"content_type": "tecnología", "target_audience": "estudiantes", "additional_context": "breve"}
+    contents = TYPES["thread"].contents(user, {"prompt": "gatos"})
+
+    assert "sobre gatos" in contents
+    assert "Este es mi publico objetivo: estudiantes" in contents
+    assert TYPES["thread"].message('["uno", "dos"]') == ["uno", "dos"]
+    assert TYPES["newsletter"].message('{"subject": "a", "title": "b", "content": ["c"]}') == {
+        "subject": "a", "title": "b", "content": ["c"],
+    }
+    assert TYPES["video_script"].message("guion") == "guion"
@@ -0,0 +1,49 @@
+import pytest
+from cocreate.utils import tokens
+from conftest import bearer
+
+
+@pytest.fixture
+def owner(database, register):
+    """A registered user with one generation, as (headers, generation ID)."""
+    user = register()
+    user_id = tokens.decode(user["access_token"])["id"]
+    database.create_generation(user_id, "video_script", "guion")
+    gen_id = database.get_generations_by_user_id(user_id)["data"][0]["id"]
+    return bearer(user["access_token"]), gen_id
+
+
+def test_save_and_unsave_result_codes(client, register, owner):
+    headers, gen_id = owner
+
+    response = client.post("/generations/save", json={"gen_id": gen_id}, headers=headers)
+    assert response.status_code == 200
+
+    response = client.post("/generations/save", json={"gen_id": str(gen_id)}, headers=headers)
+    assert (response.status_code, response.json["code"]) == (409, "already_saved")
+
+    response = client.post("/generations/save", json={"gen_id": gen_id + 1}, headers=headers)
+    assert (response.status_code, response.json["code"]) == (404, "not_found")
+
+    # Another user's generation is not found either
+    other = bearer(register("beto")["access_token"])
+    response = client.post("/generations/save", json={"gen_id": gen_id}, headers=other)
+    assert (response.status_code, response.json["code"]) == (404, "not_found")
+    response = client.post("/generations/unsave", json={"gen_id": gen_id}, headers=other)
+    assert (response.status_code, response.json["code"]) == (404, "not_saved")
+
+    assert client.post("/generations/unsave", json={"gen_id": gen_id}, headers=headers).status_code == 200
+    response = client.post("/generations/unsave", json={"gen_id": gen_id}, headers=headers)
+    assert (response.status_code, response.json["code"]) == (404, "not_saved")
+
+
+@pytest.mark.parametrize("gen_id", ["abc", "1.5", -1, 1.5, True, 2**63, [1]])
+def test_invalid_generation_ids_are_rejected(client, owner, gen_id):
+    headers, _ = owner
+
+    for path in ("/generations/save", "/generations/unsave"):
+        response = client.post(path, json={"gen_id": gen_id}, headers=headers)
+        assert (response.status_code, response.json["message"]) == (400, "ID de la generación inválido")
+
+    response = client.post("/generations/save", json={}, headers=headers)
+    assert (response.status_code, response.json["message"]) == (400, "ID de la generación requerido")
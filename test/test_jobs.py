@@ -0,0 +1,43 @@
+import json
+import threading
+from cocreate import generate
+from conftest import bearer
+
+
+def parse(chunk):
+    name, data = chunk.decode().strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_async_generation_runs_as_a_job(client, register, model, database, monkeypatch):
+    monkeypatch.setattr(generate, "JOB_POLL_INTERVAL", 0.01)
+    user = register()
+    headers = bearer(user["access_token"])
+    other = bearer(register("beto")["access_token"])
+    release = threading.Event()
+    model.reply = lambda contents: "guion" if release.wait(5) else "sin liberar"
+
+    response = client.post("/generate/video-script?async=1", json={"prompt": "gatos"}, headers=headers)
+
+    assert response.status_code == 202
+    status_url = response.json["status_url"]
+    assert response.headers["Location"] == status_url == f"/generate/jobs/{response.json['job_id']}"
+
+    # Jobs belong to the user who made them
+    assert client.get(status_url, headers=other).status_code == 404
+    assert client.get(f"{status_url}/events", headers=other).status_code == 404
+
+    stream = client.get(f"{status_url}/events", headers=headers, buffered=False)
+    received = iter(stream.response)
+    name, data = parse(next(received))
+    assert name == "status" and data["job"]["status"] in ("queued", "running")
+
+    release.set()
+    *_, (name, data) = [parse(chunk) for chunk in received]
+    assert name == "done"
+    assert data["job"]["result"] == {"success": True, "message": "guion"}
+
+    job = client.get(status_url, headers=headers).json["job"]
+    assert (job["status"], job["result"]["message"]) == ("done", "guion")
+    generations = database.get_generations_by_user_id(user["user"]["id"])["data"]
+    assert [generation["content"] for generation in generations] == ["guion"]
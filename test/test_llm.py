@@ -0,0 +1,74 @@
+import os
+import threading
+from types import SimpleNamespace
+import pytest
+from google.genai import types
+from cocreate.utils import llm
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    """No client created yet, with an API key so one can be built (no request is made)."""
+    monkeypatch.setenv("GOOGLE_AI_STUDIO_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "_client", None)
+
+
+def test_get_client_creates_one_shared_client(fresh_client, monkeypatch):
+    created = []
+    create_client = llm._create_client
+
+    def spy():
+        created.append(create_client())
+        return created[-1]
+
+    monkeypatch.setattr(llm, "_create_client", spy)
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(llm.get_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
+    assert llm.get_client() is created[0]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_children_create_their_own_client(fresh_client):
+    parent = llm.get_client()
+
+    pid = os.fork()
+    if pid == 0:
+        # Exit status 0 only if the child starts without the parent's client
+        ok = False
+        try:
+            ok = llm._client is None and llm.get_client() is not parent
+        finally:
+            os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert llm.get_client() is parent
+
+
+def test_with_timeout_sets_the_request_timeout_on_a_copy():
+    assert llm.with_timeout(None, 1500).http_options.timeout == 1500
+
+    config = types.GenerateContentConfig(response_mime_type="application/json", temperature=0.5)
+    timed = llm.with_timeout(config, 2500)
+
+    assert timed.http_options.timeout == 2500
+    assert (timed.response_mime_type, timed.temperature) == ("application/json", 0.5)
+    assert config.http_options is None
+
+
+def test_health_reports_an_unreachable_model(monkeypatch):
+    def unreachable(model):
+        raise ConnectionError("sin red")
+
+    monkeypatch.setattr(llm, "get_client", lambda: SimpleNamespace(models=SimpleNamespace(get=unreachable)))
+    assert llm.health() == {"success": False, "message": "No se pudo contactar con el modelo: sin red"}
+
+    monkeypatch.setattr(llm, "get_client", lambda: SimpleNamespace(models=SimpleNamespace(get=lambda model: None)))
+    assert llm.health()["success"] is True
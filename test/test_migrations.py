@@ -0,0 +1,75 @@
+import sqlite3
+from cocreate.utils import compression, migrations
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.create_function("decompress_chat", 2, compression.decompress, deterministic=True)
+    return conn
+
+
+def run_backfills(conn):
+    for backfill in migrations.BACKFILLS:
+        last_id = 0
+        while last_id is not None:
+            last_id = migrations.backfill_batch(conn, backfill, last_id, 2)
+
+
+def test_migrate_new_database(tmp_path):
+    conn = connect(tmp_path / "test.db")
+
+    assert migrations.migrate(conn) == [version for version, _ in migrations.MIGRATIONS]
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    assert migrations.migrate(conn) == []
+
+    user_columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    assert "generations" not in user_columns
+    assert "favorite_generations" not in user_columns
+
+
+def test_migrate_legacy_database(tmp_path):
+    conn = connect(tmp_path / "test.db")
+    migrations.MIGRATIONS[0][1](conn.cursor())
+    conn.executescript(
+        """
+        INSERT INTO generations (type, chat) VALUES ('thread', 'uno'), ('thread', 'dos'), ('newsletter', 'tres');
+        INSERT INTO users VALUES (1000, 'ana', 'x', '', '', '', '[1, 3]', '[3]');
+        INSERT INTO users VALUES (2000, 'luis', 'x', '', '', '', '[2]', '[]');
+        """
+    )
+    conn.commit()
+
+    migrations.migrate(conn)
+    run_backfills(conn)
+
+    owners = conn.execute("SELECT id, user_id, preview, size FROM generations ORDER BY id").fetchall()
+    assert owners == [(1, 1000, "uno", 3), (2, 2000, "dos", 3), (3, 1000, "tres", 4)]
+    assert conn.execute("SELECT user_id, generation_id FROM favorites").fetchall() == [(1000, 3)]
+    assert conn.execute("SELECT rowid FROM generations_fts WHERE generations_fts MATCH 'dos'").fetchall() == [(2,)]
+
+
+def test_full_text_index_keeps_no_copy_of_the_bodies(tmp_path):
+    conn = connect(tmp_path / "test.db")
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (id, username, password) VALUES (1, 'ana', 'x')")
+    conn.executemany(
+        "INSERT INTO generations (type, chat, codec, user_id) VALUES ('thread', ?, ?, 1)",
+        [(compression.compress(text)[0], compression.compress(text)[1]) for text in ("gatos negros", "perros", "gatos")],
+    )
+    conn.execute("UPDATE generations SET chat = 'aves', codec = 'raw' WHERE id = 2")
+    conn.execute("DELETE FROM generations WHERE id = 3")
+    conn.commit()
+
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert "generations_fts_content" not in tables
+
+    def search(term):
+        return conn.execute(
+            "SELECT rowid, snippet(generations_fts, 0, '[', ']', '…', 8) FROM generations_fts WHERE generations_fts MATCH ?",
+            [term],
+        ).fetchall()
+
+    assert search("gatos") == [(1, "[gatos] negros")]
+    assert search("aves") == [(2, "[aves]")]
+    assert search("perros") == []
+    conn.execute("INSERT INTO generations_fts (generations_fts) VALUES ('integrity-check')")
@@ -1,3 +1,5 @@
+import threading
+import pytest
 from cocreate.utils import password
 
 
@@ -15,3 +17,20 @@ def test_valid_password():
 
     assert password.valid(password_str, hashed_password) is True
     assert password.valid("wrong_password", hashed_password) is False
+
+
+def test_needs_rehash():
+    current = f"$2b${password.ROUNDS:02d}$abcdefghijklmnopqrstuv".encode()
+    older = f"$2b${password.ROUNDS - 1:02d}$abcdefghijklmnopqrstuv"
+
+    assert password.needs_rehash(current) is False
+    assert password.needs_rehash(older) is True
+
+
+def test_busy_when_pool_is_saturated(monkeypatch):
+    monkeypatch.setattr(password, "WORKERS", 1)
+    monkeypatch.setattr(password, "_slots", threading.BoundedSemaphore(1))
+    password._slots.acquire()
+
+    with pytest.raises(password.Busy):
+        password.hash("1234")
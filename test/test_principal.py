@@ -0,0 +1,88 @@
+import pytest
+from cocreate.utils import principal, tokens, validate
+from conftest import bearer
+
+
+@pytest.fixture
+def queries(database, monkeypatch):
+    """Record the columns of every user lookup made through get_user_columns."""
+    recorded = []
+    get_user_columns = database.get_user_columns
+
+    def spy(user_id, columns):
+        recorded.append(list(columns))
+        return get_user_columns(user_id, columns)
+
+    monkeypatch.setattr(database, "get_user_columns", spy)
+    return recorded
+
+
+def test_principal_loads_only_the_columns_read(database, queries):
+    user_id = database.create_user("ana", "Secreta123")["user_id"]
+    user = principal.Principal(id=user_id, username="ana")
+
+    assert user["username"] == "ana"
+    assert queries == []
+
+    assert user["generations"] == []
+    assert user["generations"] == []
+    assert queries == [["generations"]]
+
+    assert user.load("generations", "favorite_generations", "content_type") is True
+    assert queries == [["generations"], ["favorite_generations", "content_type"]]
+
+    # Unknown keys never reach the database
+    with pytest.raises(KeyError):
+        user["password"]
+    assert user.get("password") is None
+    assert len(queries) == 2
+
+
+def test_access_tokens_load_only_the_declared_columns(client, register, queries):
+    access_token = register()["access_token"]
+
+    result = validate.validate_jwt(access_token)
+    assert result["success"] is True
+    assert queries == []
+
+    result = validate.validate_jwt(access_token, ("generations", "favorite_generations"))
+    assert result["user"]["favorite_generations"] == []
+    assert queries == [["generations", "favorite_generations"]]
+
+    assert client.get("/user", headers=bearer(access_token)).status_code == 200
+    assert queries[-1] == ["generations", "favorite_generations"]
+
+
+def test_missing_and_malformed_authorization_is_rejected(client):
+    for headers in ({}, {"Authorization": "Token abc"}):
+        response = client.get("/user", headers=headers)
+        assert (response.status_code, response.json["message"]) == (401, "Token de autorización requerido")
+
+    response = client.get("/user", headers=bearer(""))
+    assert (response.status_code, response.json["message"]) == (401, "El token no puede estar vacío.")
+
+    response = client.get("/user", headers=bearer("abc"))
+    assert (response.status_code, response.json["message"]) == (401, "Token inválido.")
+
+
+def test_expired_and_revoked_tokens_are_rejected(client, register, monkeypatch):
+    access_token = register()["access_token"]
+    updated = client.post("/settings/content-type", json={"content_type": "humor"}, headers=bearer(access_token))
+    assert updated.status_code == 200
+
+    response = client.get("/user", headers=bearer(access_token))
+    assert (response.status_code, response.json["message"]) == (401, "Token revocado.")
+    assert client.get("/user", headers=bearer(updated.json["access_token"])).json["user"]["content_type"] == "humor"
+
+    monkeypatch.setattr(tokens, "ACCESS_TOKEN_TTL", -1)
+    response = client.get("/user", headers=bearer(register("beto")["access_token"]))
+    assert (response.status_code, response.json["message"]) == (401, "Token expirado.")
+
+
+def test_tokens_of_unknown_users_are_rejected(client, register, database):
+    user = register()
+    # Deleted by another worker, so this process has not revoked its tokens
+    database.delete_user(user["user"]["id"])
+
+    response = client.get("/user", headers=bearer(user["access_token"]))
+    assert (response.status_code, response.json["message"]) == (401, "Token inválido - no se encuentra el usuario.")
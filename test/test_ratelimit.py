@@ -0,0 +1,75 @@
+import pytest
+import cocreate
+from cocreate.utils import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_limiter_refills():
+    clock = Clock()
+    limiter = ratelimit.MemoryLimiter(capacity=3, rate=1, clock=clock)
+
+    assert [limiter.acquire("1.2.3.4") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("1.2.3.4") == 1
+    assert limiter.acquire("5.6.7.8") == 0
+
+    clock.now += 1
+    assert limiter.acquire("1.2.3.4") == 0
+    assert limiter.acquire("1.2.3.4") > 0
+
+
+def test_memory_limiter_drops_full_buckets():
+    clock = Clock()
+    limiter = ratelimit.MemoryLimiter(capacity=2, rate=0.5, clock=clock)
+
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("b")
+    assert len(limiter) == 2
+
+    clock.now += 3
+    limiter.acquire("c")
+    assert len(limiter) == 2
+
+    # Buckets refilling after more than a wheel turn still expire
+    clock.now += ratelimit.WHEEL_SLOTS * 3
+    limiter.acquire("c")
+    assert len(limiter) == 1
+
+
+def test_sqlite_limiter_is_shared(tmp_path):
+    clock = Clock()
+    database = str(tmp_path / "ratelimit.db")
+    first = ratelimit.SQLiteLimiter("ip", 2, 1, database=database, clock=clock)
+    second = ratelimit.SQLiteLimiter("ip", 2, 1, database=database, clock=clock)
+
+    assert first.acquire("1.2.3.4") == 0
+    assert second.acquire("1.2.3.4") == 0
+    assert first.acquire("1.2.3.4") == 1
+
+    clock.now += 1
+    assert second.acquire("1.2.3.4") == 0
+
+
+@pytest.mark.parametrize("trusted_proxies, throttled", [(0, [False, True, True]), (1, [False, False, True])])
+def test_forwarded_addresses_are_only_trusted_behind_a_proxy(client, monkeypatch, trusted_proxies, throttled):
+    monkeypatch.setattr(cocreate, "TRUSTED_PROXIES", trusted_proxies)
+    monkeypatch.setattr(ratelimit, "_by_ip", ratelimit.MemoryLimiter(1, 0.001))
+    app = cocreate.create_app().test_client()
+
+    statuses = [
+        app.post(
+            "/auth/login",
+            json={"username": "ana", "password": "Secreta123"},
+            headers={"X-Forwarded-For": address},
+        ).status_code
+        for address in ("203.0.113.1", "203.0.113.2", "203.0.113.2")
+    ]
+
+    assert [status == 429 for status in statuses] == throttled
@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+from cocreate.utils import cache, db, responsecache
+
+
+class Schema(BaseModel):
+    title: str
+
+
+def test_key_covers_the_whole_request():
+    base = responsecache.key("content_idea", "ideas sobre gatos", "model")
+
+    assert base == responsecache.key("content_idea", "ideas sobre gatos", "model")
+    assert base != responsecache.key("video_script", "ideas sobre gatos", "model")
+    assert base != responsecache.key("content_idea", "ideas sobre perros", "model")
+    assert base != responsecache.key("content_idea", "ideas sobre gatos", "other-model")
+    assert base != responsecache.key("content_idea", "ideas sobre gatos", "model", responsecache.schema_key(Schema))
+
+
+def test_database_tier_refills_memory(database, monkeypatch):
+    monkeypatch.setattr(responsecache, "_memory", cache.LRUCache(4, 60))
+
+    responsecache.set("key", "respuesta " * 100)
+    responsecache._memory.clear()
+
+    assert responsecache.get("key") == "respuesta " * 100
+    assert responsecache.stats()["size"] == 1
+    assert responsecache.get("missing") is None
+
+    assert db.evict_cached_responses(0, 0) == 1
@@ -0,0 +1,56 @@
+import threading
+import time
+from cocreate.utils import scheduler
+
+
+def _queue_up(queue, calls, served):
+    """Start a thread per (user, priority) call; each records its user once it gets the slot."""
+    threads = []
+    for user, priority in calls:
+        def run(user=user, priority=priority):
+            queue.acquire(user, priority)
+            served.append(user)
+            queue.release()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        # Wait until it is queued, so arrival order is deterministic
+        while queue.stats()["waiting"] < len(threads):
+            time.sleep(0.001)
+    return threads
+
+
+def test_busy_user_does_not_delay_others():
+    queue = scheduler.FairQueue(1)
+    queue.acquire("holder")
+    served = []
+
+    threads = _queue_up(queue, [("busy", "interactive")] * 4 + [("light", "interactive")], served)
+    queue.release()
+    for thread in threads:
+        thread.join()
+
+    # Served second, not behind the busy user's whole backlog
+    assert served.index("light") == 1
+
+
+def test_interactive_calls_go_ahead_of_batch_ones():
+    queue = scheduler.FairQueue(1)
+    queue.acquire("holder")
+    served = []
+
+    threads = _queue_up(queue, [("bulk", "batch")] * 3 + [("person", "interactive")], served)
+    queue.release()
+    for thread in threads:
+        thread.join()
+
+    assert served[0] == "person"
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    queue = scheduler.FairQueue(1)
+    queue.acquire("holder")
+
+    assert not queue.acquire("other", timeout=0.01)
+    assert queue.stats() == {"limit": 1, "in_flight": 1, "waiting": 0}
@@ -0,0 +1,86 @@
+import pytest
+from cocreate.utils import tokens
+from conftest import bearer
+
+
+@pytest.fixture
+def searcher(client, database, register):
+    """Search as a user who owns a few generations, next to another user's matching one."""
+    user = register()
+    user_id = tokens.decode(user["access_token"])["id"]
+    for generation_type, chat in [
+        ("video_script", "Un guion sobre gatos negros y su canción favorita"),
+        ("thread", "Un hilo sobre gatos y perros"),
+        ("video_script", "Un guion sobre perros"),
+        ("content_idea", "Ideas sobre gatos"),
+        ("thread", "<script>alert('loros')</script> & <b>loros</b>"),
+    ]:
+        database.create_generation(user_id, generation_type, chat)
+
+    other_id = tokens.decode(register("beto")["access_token"])["id"]
+    database.create_generation(other_id, "video_script", "Gatos de otro usuario")
+
+    def search(**params):
+        return client.get("/generations/search", query_string=params, headers=bearer(user["access_token"]))
+
+    return search
+
+
+def contents(response):
+    return sorted(result["snippet"] for result in response.json["results"])
+
+
+def test_search_matches_every_word_of_the_owner_only(searcher):
+    response = searcher(q="gatos")
+
+    assert response.status_code == 200
+    assert len(response.json["results"]) == 3
+    assert all("<mark>gatos</mark>" in snippet.lower() for snippet in contents(response))
+
+    assert contents(searcher(q="gatos perros")) == ["Un hilo sobre <mark>gatos</mark> y <mark>perros</mark>"]
+
+
+def test_search_matches_prefixes_and_ignores_accents(searcher):
+    assert len(searcher(q="gat").json["results"]) == 3
+    assert contents(searcher(q="cancion")) == [
+        "Un guion sobre gatos negros y su <mark>canción</mark> favorita",
+    ]
+
+
+@pytest.mark.parametrize("text, matches", [
+    ('gatos" OR perros', 0),
+    ("gatos NOT perros", 0),
+    ("NEAR(gatos perros)", 0),
+    ("gatos*)(", 3),
+    ("^gatos", 3),
+])
+def test_search_text_is_never_parsed_as_query_syntax(searcher, text, matches):
+    # Operators are searched for as plain words, which no generation contains
+    response = searcher(q=text)
+    assert (response.status_code, len(response.json["results"])) == (200, matches)
+
+
+def test_search_without_words_finds_nothing(searcher):
+    response = searcher(q='"*()')
+    assert (response.status_code, response.json["results"]) == (200, [])
+
+
+def test_search_filters_by_type(searcher):
+    results = searcher(q="gatos", type="video_script").json["results"]
+    assert [result["type"] for result in results] == ["video_script"]
+
+    assert searcher(q="gatos", type="newsletter").json["results"] == []
+
+
+def test_search_limit(searcher):
+    assert len(searcher(q="gatos", limit=2).json["results"]) == 2
+
+    for limit in (0, 101):
+        assert searcher(q="gatos", limit=limit).status_code == 400
+    assert searcher(q="  ").status_code == 400
+
+
+def test_snippets_escape_generation_markup(searcher):
+    assert contents(searcher(q="loros")) == [
+        "&lt;script&gt;alert(&#x27;<mark>loros</mark>&#x27;)&lt;/script&gt; &amp; &lt;b&gt;<mark>loros</mark>&lt;/b&gt;",
+    ]
@@ -0,0 +1,54 @@
+import threading
+import time
+import pytest
+from cocreate.utils import singleflight
+
+
+def test_concurrent_calls_share_the_leader_result():
+    group = singleflight.Group(timeout=5)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "respuesta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["respuesta"] * 5
+    assert len(calls) == 1
+    assert group.stats() == {"in_flight": 0, "coalesced": 4, "timeouts": 0}
+
+
+def test_followers_fall_back_after_timeout():
+    group = singleflight.Group(timeout=0.05)
+    leader = threading.Thread(target=group.do, args=("key", time.sleep, 0.3))
+    leader.start()
+    time.sleep(0.05)
+
+    assert group.do("key", lambda: "propia") == "propia"
+    assert group.stats()["timeouts"] == 1
+    leader.join()
+
+
+def test_leader_errors_are_shared():
+    group = singleflight.Group(timeout=5)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("fallo")
+
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, group.do, "key", failing))
+    leader.start()
+    started.wait()
+
+    with pytest.raises(RuntimeError):
+        group.do("key", lambda: "no se llama")
+    leader.join()
@@ -0,0 +1,98 @@
+import json
+import pytest
+from cocreate.utils import gateway, writer
+from conftest import bearer
+
+
+@pytest.fixture
+def stream(client, register, model, monkeypatch):
+    """Post a streamed video script request as a new user; generations are written synchronously."""
+    monkeypatch.setattr(writer, "MODE", "sync")
+    user = register()
+
+    def stream(prompt="gatos", **kwargs):
+        return client.post(
+            "/generate/video-script",
+            json={"prompt": prompt},
+            headers={**bearer(user["access_token"]), "Accept": "text/event-stream"},
+            **kwargs,
+        )
+
+    stream.user_id = user["user"]["id"]
+    return stream
+
+
+def events(body):
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        parsed.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return parsed
+
+
+def stored(database, user_id):
+    return [generation["content"] for generation in database.get_generations_by_user_id(user_id)["data"]]
+
+
+def slots_in_use():
+    stats = gateway.stats()
+    return stats["in_flight"] + sum(bulkhead["in_flight"] for bulkhead in stats["types"].values())
+
+
+def test_chunks_then_done_and_the_joined_text_is_saved(stream, model, database):
+    model.chunks = lambda contents: ["Hola ", "", "mundo"]
+
+    response = stream()
+
+    assert response.mimetype == "text/event-stream"
+    assert events(response.get_data(as_text=True)) == [
+        ("chunk", {"text": "Hola "}),
+        ("chunk", {"text": "mundo"}),
+        ("done", {"success": True}),
+    ]
+    assert stored(database, stream.user_id) == ["Hola mundo"]
+    assert slots_in_use() == 0
+
+
+def test_upstream_failure_midway_sends_an_error_event(stream, model, database):
+    def chunks(contents):
+        yield "Hola "
+        raise RuntimeError("conexión perdida")
+
+    model.chunks = chunks
+
+    assert events(stream().get_data(as_text=True)) == [
+        ("chunk", {"text": "Hola "}),
+        ("error", {"success": False, "message": "Ocurrió un error: conexión perdida"}),
+    ]
+    assert stored(database, stream.user_id) == []
+    assert slots_in_use() == 0
+
+
+def test_client_disconnect_abandons_the_stream(stream, model, database):
+    model.chunks = lambda contents: ["Hola ", "mundo"]
+
+    response = stream(buffered=False)
+    assert next(iter(response.response)).startswith(b"event: chunk")
+    assert slots_in_use() == 2
+    response.close()
+
+    assert model.streams_closed == 1
+    assert slots_in_use() == 0
+    assert stored(database, stream.user_id) == []
+
+    # Nothing was cached either, so the next request calls the model again
+    stream().get_data()
+    assert len(model.calls) == 2
+
+
+def test_cached_response_is_replayed_as_one_chunk(stream, model, database):
+    model.chunks = lambda contents: ["Hola ", "mundo"]
+    stream().get_data()
+
+    assert events(stream().get_data(as_text=True)) == [
+        ("chunk", {"text": "Hola mundo"}),
+        ("done", {"success": True}),
+    ]
+    assert len(model.calls) == 1
+    assert stored(database, stream.user_id) == ["Hola mundo", "Hola mundo"]
@@ -0,0 +1,109 @@
+import jwt
+from cocreate.utils import tokens
+from conftest import bearer
+
+
+def test_login_issues_tokens_that_authenticate_and_refresh(client, register):
+    register()
+    login = client.post("/auth/login", json={"username": "ana", "password": "Secreta123"}).json
+
+    assert client.get("/user", headers=bearer(login["access_token"])).json["user"]["username"] == "ana"
+
+    refreshed = client.post("/auth/refresh", json={"refresh_token": login["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert client.get("/user", headers=bearer(refreshed.json["access_token"])).status_code == 200
+
+    # Refresh tokens are not access tokens and vice versa
+    assert client.get("/user", headers=bearer(login["refresh_token"])).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": login["access_token"]}).status_code == 401
+
+
+def test_expired_tokens_are_rejected(client, register, monkeypatch):
+    monkeypatch.setattr(tokens, "ACCESS_TOKEN_TTL", -1)
+    monkeypatch.setattr(tokens, "REFRESH_TOKEN_TTL", -1)
+    user = register()
+
+    response = client.get("/user", headers=bearer(user["access_token"]))
+    assert (response.status_code, response.json["message"]) == (401, "Token expirado.")
+
+    response = client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]})
+    assert (response.status_code, response.json["message"]) == (401, "Token expirado")
+
+
+def test_password_change_revokes_earlier_tokens(client, register):
+    user = register()
+
+    changed = client.post("/auth/update-password", json={"password": "Nueva1234"}, headers=bearer(user["access_token"]))
+    assert changed.status_code == 200
+
+    response = client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]})
+    assert (response.status_code, response.json["message"]) == (401, "Token revocado")
+    assert client.get("/user", headers=bearer(user["access_token"])).status_code == 401
+
+    assert client.post("/auth/refresh", json={"refresh_token": changed.json["refresh_token"]}).status_code == 200
+    assert client.get("/user", headers=bearer(changed.json["access_token"])).status_code == 200
+
+
+def test_deleted_account_tokens_are_rejected(client, register):
+    user = register()
+
+    assert client.delete("/settings/delete-account", headers=bearer(user["access_token"])).status_code == 200
+
+    assert client.get("/user", headers=bearer(user["access_token"])).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]}).status_code == 401
+
+
+def test_legacy_tokens_only_until_the_cutoff_and_password_change(client, register, monkeypatch):
+    user = register()
+    legacy = jwt.encode({"id": user["user"]["id"]}, "test-secret", algorithm="HS256")
+
+    assert client.get("/user", headers=bearer(legacy)).status_code == 401
+
+    monkeypatch.setattr(tokens, "LEGACY_TOKENS_UNTIL", 2**40)
+    assert client.get("/user", headers=bearer(legacy)).status_code == 200
+
+    client.post("/auth/update-password", json={"password": "Nueva1234"}, headers=bearer(user["access_token"]))
+    response = client.get("/user", headers=bearer(legacy))
+    assert (response.status_code, response.json["message"]) == (401, "Token revocado.")
+
+
+def test_refresh_sees_password_changes_made_by_other_workers(client, register, database):
+    user = register()
+    user_id = user["user"]["id"]
+    # Another worker changes the password, then deletes the account
+    conn = database.get_connection()
+    conn.execute("UPDATE users SET credential_version = credential_version + 1 WHERE id = ?", [user_id])
+    conn.commit()
+    database.release_connection(conn)
+
+    response = client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]})
+    assert (response.status_code, response.json["message"]) == (401, "Token revocado")
+
+    conn = database.get_connection()
+    conn.execute("DELETE FROM users WHERE id = ?", [user_id])
+    conn.commit()
+    database.release_connection(conn)
+
+    response = client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]})
+    assert (response.status_code, response.json["message"]) == (401, "Token inválido - no se encuentra el usuario")
+
+
+def test_reissued_tokens_carry_the_whole_profile_for_legacy_callers(client, register, database, monkeypatch):
+    user_id = register()["user"]["id"]
+    database.update_user_target_audience(user_id, "estudiantes")
+    database.update_user_additional_context(user_id, "breve")
+    monkeypatch.setattr(tokens, "LEGACY_TOKENS_UNTIL", 2**40)
+    legacy = bearer(jwt.encode({"id": user_id}, "test-secret", algorithm="HS256"))
+
+    profile = {"username": "ana", "content_type": "humor", "target_audience": "estudiantes", "additional_context": "breve"}
+    for path, body in [
+        ("/settings/content-type", {"content_type": "humor"}),
+        ("/settings/target", {"target_audience": "estudiantes"}),
+        ("/settings/additional-context", {"additional_context": "breve"}),
+        ("/auth/update-password", {"password": "Nueva1234"}),
+    ]:
+        response = client.post(path, json=body, headers=legacy)
+        assert response.status_code == 200, path
+
+        claims = tokens.decode(response.json["access_token"])
+        assert {claim: claims[claim] for claim in tokens.PROFILE_CLAIMS} == profile, path
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+import pytest
+from cocreate.utils import writer
+
+
+@pytest.fixture
+def user_id(database, monkeypatch):
+    """A user to write generations for, with a writer whose thread is not started yet."""
+    monkeypatch.setattr(writer, "_queue", queue.Queue(maxsize=writer.QUEUE_SIZE))
+    monkeypatch.setattr(writer, "_thread", None)
+
+    yield database.create_user("ana", "Secreta123")["user_id"]
+
+    writer.stop()
+
+
+def stored(database, user_id):
+    return sorted(generation["content"] for generation in database.get_generations_by_user_id(user_id)["data"])
+
+
+def run_queued():
+    """Run the writer loop on this thread over what is queued so far."""
+    writer._queue.put(writer._STOP)
+    writer._run()
+
+
+def test_async_mode_queues_and_stop_flushes(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "async")
+
+    for index in range(5):
+        result = writer.submit(user_id, "video_script", f"guion {index}")
+        assert result == {"success": True, "message": "Generación encolada."}
+
+    writer.stop()
+    assert stored(database, user_id) == [f"guion {index}" for index in range(5)]
+
+
+def test_queued_generations_are_written_in_one_batch(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "async")
+    monkeypatch.setattr(writer, "_ensure_started", lambda: None)
+    batches = []
+    create_generations = database.create_generations
+
+    def spy(generations):
+        batches.append(len(generations))
+        return create_generations(generations)
+
+    monkeypatch.setattr(database, "create_generations", spy)
+
+    for index in range(3):
+        writer.submit(user_id, "thread", f"hilo {index}")
+    run_queued()
+
+    assert batches == [3]
+    assert stored(database, user_id) == ["hilo 0", "hilo 1", "hilo 2"]
+
+
+def test_group_mode_waits_for_the_commit(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "group")
+
+    result = writer.submit(user_id, "video_script", "guion")
+
+    assert result["success"] is True
+    assert result["count"] == 1
+    assert stored(database, user_id) == ["guion"]
+
+
+def test_sync_mode_writes_on_the_caller_thread(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "sync")
+
+    assert writer.submit(user_id, "video_script", "guion") == {"success": True, "message": "Generación guardada."}
+    assert writer._thread is None
+    assert stored(database, user_id) == ["guion"]
+
+
+def test_full_queue_falls_back_to_a_sync_write(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "async")
+    monkeypatch.setattr(writer, "_queue", queue.Queue(maxsize=1))
+    monkeypatch.setattr(writer, "ENQUEUE_TIMEOUT", 0.01)
+    # Nothing drains the queue
+    monkeypatch.setattr(writer, "_ensure_started", lambda: None)
+
+    assert writer.submit(user_id, "video_script", "encolado")["message"] == "Generación encolada."
+    assert writer.submit(user_id, "video_script", "directo")["message"] == "Generación guardada."
+    assert stored(database, user_id) == ["directo"]
+
+    writer._write([writer._queue.get_nowait()])
+    assert stored(database, user_id) == ["directo", "encolado"]
+
+
+def test_failed_batch_is_retried_one_by_one(database, user_id, monkeypatch):
+    monkeypatch.setattr(writer, "MODE", "group")
+    monkeypatch.setattr(writer, "_ensure_started", lambda: None)
+    results = {}
+
+    def submit(owner, chat):
+        results[chat] = writer.submit(owner, "video_script", chat)
+
+    # The unknown user's row breaks the batch's foreign key
+    threads = [
+        threading.Thread(target=submit, args=(user_id, "bueno")),
+        threading.Thread(target=submit, args=(user_id + 1, "huérfano")),
+    ]
+    for thread in threads:
+        thread.start()
+    while writer._queue.qsize() < 2:
+        time.sleep(0.01)
+
+    run_queued()
+    for thread in threads:
+        thread.join()
+
+    assert results["bueno"] == {"success": True, "message": "Generación guardada."}
+    assert results["huérfano"]["success"] is False
+    assert stored(database, user_id) == ["bueno"]